@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import inspect
+
+curDir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentDir = os.path.dirname(curDir)
+sys.path.insert(0, parentDir)
+
+from uniparser_morph import Analyzer
+
+
+def read_words(fname, maxWords=None):
+    words = []
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        for line in fIn:
+            word = line.strip('\r\n').split('\t')[0]
+            if len(word) > 0:
+                words.append(word)
+            if maxWords is not None and len(words) >= maxWords:
+                break
+    return words
+
+
+def benchmark(parsingMethod, words, replacementsAllowed=0):
+    """
+    Initialize the parser with the given parsing method, analyze
+    the words and return the analyses and the time it took.
+    """
+    a = Analyzer()
+    a.parsingMethod = parsingMethod
+    t1 = time.time()
+    a.load_grammar()
+    a.initialize_parser()
+    tInit = time.time() - t1
+    t1 = time.time()
+    analyses = []
+    for word in words:
+        analyses.append(sorted(str(ana) for ana in a.analyze_words(word, format='json',
+                                                                   replacementsAllowed=replacementsAllowed)))
+    tParse = time.time() - t1
+    return analyses, tInit, tParse
+
+
+if __name__ == '__main__':
+    # Usage: benchmark_parsing_methods.py [wordlist.csv] [replacementsAllowed]
+    # The grammar files are taken from the current folder.
+    freqListFile = 'wordlist.csv'
+    replacementsAllowed = 0
+    if len(sys.argv) > 1:
+        freqListFile = sys.argv[1]
+    if len(sys.argv) > 2:
+        replacementsAllowed = int(sys.argv[2])
+    words = read_words(freqListFile)
+    print(len(words), 'words,', replacementsAllowed, 'replacements allowed.')
+    results = {}
+    for parsingMethod in ['fst', 'suffix', 'hash']:
+        analyses, tInit, tParse = benchmark(parsingMethod, words,
+                                            replacementsAllowed=replacementsAllowed)
+        results[parsingMethod] = analyses
+        print(parsingMethod + ': initialized in', round(tInit, 2), 'seconds, analyzed in',
+              round(tParse, 2), 'seconds (' + str(round(len(words) / max(tParse, 0.001))),
+              'words per second).')
+    for parsingMethod in ['suffix', 'hash']:
+        nDifferent = sum(1 for i in range(len(words))
+                         if results[parsingMethod][i] != results['fst'][i])
+        print(parsingMethod + ':', nDifferent, 'words analyzed differently than with fst.')
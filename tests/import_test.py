@@ -66,6 +66,20 @@ if __name__ == '__main__':
     analyses = a.analyze_words('юртъёсаз', format='conll')
     print(analyses)
 
+    # Test the persistent analysis cache: the analyses taken from
+    # the file must be the same as the freshly made ones
+    a.g.COMPLEX_WF_AS_BAGS = False
+    a.m.set_disk_cache('test-analyses.sqlite', 'import_test')
+    for w in ['юртъёсаз', 'котькудhkao', 'бырйыны', 'коьткудазгес']:
+        fresh = [ana.to_json() for ana in a.m.parse(w, replacementsAllowed=1)]
+        a.m.diskCache.commit()
+        cached = [ana.to_json() for ana in a.m.parse(w, replacementsAllowed=1)]
+        print(w, 'cached analyses are the same:', fresh == cached,
+              '(' + str(a.m.diskCache.hits) + ' hits)')
+    a.m.set_disk_cache(None, None)
+    os.remove('test-analyses.sqlite')
+    a.g.COMPLEX_WF_AS_BAGS = True
+
     # Test simple derivations
     analyses = a.analyze_words('тулы')
     print(analyses)
@@ -17,6 +17,11 @@ class ErrorHandler:
     def __deepcopy__(self, memo):
         return self
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('f', None)    # file objects cannot be pickled
+        return state
+
     def raise_error(self, errorMessage, data=None):
         if data is not None:
             try:
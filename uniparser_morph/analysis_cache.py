@@ -0,0 +1,138 @@
+import sys
+from collections import OrderedDict
+
+
+class AnalysisCache:
+    """
+    A bounded key -> value cache used to remember analyses.
+    The size can be limited by the number of entries and/or by the
+    approximate number of bytes the values take. Two eviction policies
+    are available:
+    - 'lru': the entry that has not been used for the longest time
+      is evicted first;
+    - 'freq': segmented LRU. New entries go to the probation segment
+      and are moved to the protected segment when they are requested
+      again. Entries that have been requested only once are evicted
+      first, so that a stream of rare words cannot push out the
+      frequent ones.
+    """
+    POLICIES = ('lru', 'freq')
+    PROTECTED_SHARE = 0.8       # share of the cache reserved for protected entries ('freq')
+
+    def __init__(self, maxEntries=100000, maxBytes=0, policy='lru', sizeFunc=None):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown cache policy: ' + str(policy))
+        self.maxEntries = maxEntries    # 0 or None means no limit
+        self.maxBytes = maxBytes        # 0 or None means no limit
+        self.policy = policy
+        self.sizeFunc = sizeFunc        # value -> approximate size in bytes
+        self.probation = OrderedDict()  # key -> (value, size); the only segment for 'lru'
+        self.protected = OrderedDict()  # key -> (value, size); only used with 'freq'
+        self.curBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.probation) + len(self.protected)
+
+    def __contains__(self, key):
+        return key in self.probation or key in self.protected
+
+    def approx_size(self, key, value):
+        if self.sizeFunc is not None:
+            return sys.getsizeof(key) + self.sizeFunc(value)
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key, default=None):
+        """
+        Return the value stored under the key, or default if there
+        is no such key. Count the hit or the miss.
+        """
+        if key in self.protected:
+            self.protected.move_to_end(key)
+            self.hits += 1
+            return self.protected[key][0]
+        if key not in self.probation:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.policy == 'lru':
+            self.probation.move_to_end(key)
+            return self.probation[key][0]
+        # 'freq': the entry has been requested again, protect it
+        entry = self.probation.pop(key)
+        self.protected[key] = entry
+        maxProtected = self.protected_capacity()
+        while len(self.protected) > maxProtected > 0:
+            demotedKey, demotedEntry = self.protected.popitem(last=False)
+            self.probation[demotedKey] = demotedEntry
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Store the value under the key and evict old entries if the
+        cache has become too large.
+        """
+        self.discard(key)
+        size = 0
+        if self.maxBytes is not None and self.maxBytes > 0:
+            size = self.approx_size(key, value)
+            if size > self.maxBytes:
+                # Would evict everything else and still not fit
+                return
+        self.probation[key] = (value, size)
+        self.curBytes += size
+        self.shrink()
+
+    def discard(self, key):
+        for segment in (self.probation, self.protected):
+            if key in segment:
+                self.curBytes -= segment.pop(key)[1]
+                return
+
+    def protected_capacity(self):
+        if self.maxEntries is None or self.maxEntries <= 0:
+            return 0
+        return max(1, int(self.maxEntries * self.PROTECTED_SHARE))
+
+    def is_too_large(self):
+        if self.maxEntries is not None and 0 < self.maxEntries < len(self):
+            return True
+        if self.maxBytes is not None and 0 < self.maxBytes < self.curBytes:
+            return True
+        return False
+
+    def shrink(self):
+        while self.is_too_large() and len(self) > 0:
+            if len(self.probation) > 0:
+                key, entry = self.probation.popitem(last=False)
+            else:
+                key, entry = self.protected.popitem(last=False)
+            self.curBytes -= entry[1]
+            self.evictions += 1
+
+    def clear(self):
+        self.probation.clear()
+        self.protected.clear()
+        self.curBytes = 0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the cache size and usage counters.
+        """
+        nRequests = self.hits + self.misses
+        hitRate = 0.0
+        if nRequests > 0:
+            hitRate = self.hits / nRequests
+        return {
+            'entries': len(self),
+            'bytes': self.curBytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': hitRate
+        }
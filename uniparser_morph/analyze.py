@@ -1,10 +1,12 @@
 import time
 import os
 import html
+import pickle
 from .morph_parser import Parser
 from .grammar import Grammar
 from .wordform import Wordform
 from .cg_disambiguate import CGDisambiguator
+from .grammar_snapshot import grammar_fingerprint, save_snapshot, load_snapshot
 
 
 class Analyzer:
@@ -38,6 +40,18 @@ class Analyzer:
         self.minFlexLen = 4
         self.maxCompileTime = 60
         self.flattenSubwords = False
+        self.compactFsts = False            # keep the FSTs in compact read-only arrays
+        self.determinizeParadigms = False   # use deterministic FSTs for affixes
+        self.fuzzyStemIndex = False         # index the stems for the search with replacements
+        self.nWorkers = 1                   # number of processes for analyze_wordlist()
+        self.sortFreqList = True            # analyze the frequency list in the order of frequency
+        self.compiledGrammarFile = None     # where to keep the compiled grammar between runs
+        self.cacheParses = False            # remember analyses of the words already seen
+        self.parseCacheSize = 100000        # max number of words in that cache
+        self.parseCacheBytes = 0            # approximate max size of that cache (0 = no limit)
+        self.parseCachePolicy = 'lru'       # 'lru' or 'freq'
+        self.analysisCacheFile = None       # SQLite file where analyses are kept between runs
+        self.grammarFingerprint = None
 
     def collect_filenames(self, s):
         """
@@ -57,30 +71,112 @@ class Analyzer:
                 filenames = [s]
         return filenames
 
+    def grammar_files(self):
+        """
+        Return a dictionary {file type -> list of filenames} with all
+        the files the grammar is loaded from.
+        """
+        return {
+            'paradigms': self.collect_filenames(self.paradigmFile),
+            'lexemes': self.collect_filenames(self.lexFile),
+            'lex_rules': self.collect_filenames(self.lexRulesFile),
+            'derivations': self.collect_filenames(self.derivFile),
+            'conversions': self.collect_filenames(self.conversionFile),
+            'clitics': self.collect_filenames(self.cliticFile),
+            'bad_analyses': self.collect_filenames(self.delAnaFile),
+            'categories': self.collect_filenames(self.categoriesFile)
+        }
+
+    def grammar_options(self):
+        """
+        Return a dictionary with the settings that affect the compiled
+        grammar and the structures built by the parser.
+        """
+        return {
+            'partialCompile': self.partialCompile,
+            'minFlexLen': self.minFlexLen,
+            'maxCompileTime': self.maxCompileTime,
+            'parsingMethod': self.parsingMethod,
+            'compactFsts': self.compactFsts,
+            'determinizeParadigms': self.determinizeParadigms,
+            'fuzzyStemIndex': self.fuzzyStemIndex
+        }
+
+    def load_compiled_grammar(self, verbose=False):
+        """
+        Try loading the compiled grammar and the initialized parser
+        from self.compiledGrammarFile. Return True if it was made from
+        the current versions of the grammar files with current settings,
+        otherwise return False.
+        """
+        if self.compiledGrammarFile is None or len(self.compiledGrammarFile) <= 0:
+            return False
+        snapshot = load_snapshot(self.compiledGrammarFile, self.grammarFingerprint)
+        if snapshot is None:
+            if verbose:
+                print('No up-to-date compiled grammar in', self.compiledGrammarFile)
+            return False
+        self.g, self.m = snapshot
+        self.disambiguator = CGDisambiguator(self.g)
+        self.m.verbose = self.parserVerbosity
+        Wordform.verbosity = self.parserVerbosity
+        self.configure_parse_cache()
+        return True
+
+    def save_compiled_grammar(self, verbose=False):
+        """
+        Save the compiled grammar and the initialized parser
+        to self.compiledGrammarFile.
+        """
+        if self.compiledGrammarFile is None or len(self.compiledGrammarFile) <= 0:
+            return
+        self.initialize_parser(verbose=verbose)
+        try:
+            save_snapshot(self.compiledGrammarFile, self.grammarFingerprint, self.g, self.m)
+        except (IOError, OSError, RecursionError,
+                pickle.PicklingError, TypeError, AttributeError) as e:
+            # The grammar has been compiled anyway, so this is not fatal
+            self.g.raise_error('Could not save the compiled grammar to ' + self.compiledGrammarFile
+                               + ': ' + type(e).__name__ + ': ' + str(e))
+            return
+        if verbose:
+            print('Compiled grammar saved to', self.compiledGrammarFile)
+
     def load_grammar(self, verbose=False):
         """
         Load dictionaries and rules to be used for parsing.
         If verbose == True, print messages.
+        If compiledGrammarFile is set, reuse the compiled grammar
+        stored there, provided none of the grammar files and options
+        have changed since. Otherwise, compile the grammar, initialize
+        the parser and store them in that file.
         """
         t1 = time.time()
         self.m = None       # Reset parser
-        self.g.PARTIAL_COMPILE = self.partialCompile
-        self.g.MIN_FLEX_LENGTH = self.minFlexLen
-        self.g.MAX_COMPILE_TIME = self.maxCompileTime
-        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
-        paradigmFiles = self.collect_filenames(self.paradigmFile)
-        lexFiles = self.collect_filenames(self.lexFile)
-        lexRulesFiles = self.collect_filenames(self.lexRulesFile)
-        derivFiles = self.collect_filenames(self.derivFile)
-        conversionFiles = self.collect_filenames(self.conversionFile)
-        cliticFiles = self.collect_filenames(self.cliticFile)
-        delAnaFiles = self.collect_filenames(self.delAnaFile)
-        categoriesFiles = self.collect_filenames(self.categoriesFile)
-
         if self.parsedFile is None or len(self.parsedFile) <= 0:
             self.parsedFile = self.freqListFile + '-parsed.txt'
         if self.unparsedFile is None or len(self.unparsedFile) <= 0:
             self.unparsedFile = self.freqListFile + '-unparsed.txt'
+        grammarFiles = self.grammar_files()
+        self.grammarFingerprint = grammar_fingerprint(grammarFiles, self.grammar_options())
+        if self.load_compiled_grammar(verbose=verbose):
+            self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+            if verbose:
+                print('Compiled grammar loaded in', time.time() - t1, 'seconds.')
+            return
+
+        self.g.PARTIAL_COMPILE = self.partialCompile
+        self.g.MIN_FLEX_LENGTH = self.minFlexLen
+        self.g.MAX_COMPILE_TIME = self.maxCompileTime
+        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+        paradigmFiles = grammarFiles['paradigms']
+        lexFiles = grammarFiles['lexemes']
+        lexRulesFiles = grammarFiles['lex_rules']
+        derivFiles = grammarFiles['derivations']
+        conversionFiles = grammarFiles['conversions']
+        cliticFiles = grammarFiles['clitics']
+        delAnaFiles = grammarFiles['bad_analyses']
+        categoriesFiles = grammarFiles['categories']
 
         n = self.g.load_categories(categoriesFiles)
         if verbose:
@@ -109,6 +205,7 @@ class Analyzer:
         self.g.compile_all()
         if verbose:
             print('Paradigms and lexemes loaded and compiled in', time.time() - t1, 'seconds.')
+        self.save_compiled_grammar(verbose=verbose)
 
     def initialize_parser(self, verbose=False):
         """
@@ -123,16 +220,75 @@ class Analyzer:
             self.m = Parser(g=self.g,
                             verbose=self.parserVerbosity,
                             parsingMethod=self.parsingMethod)
+            self.m.COMPACT_FSTS = self.compactFsts
+            self.m.DETERMINIZE_PARADIGMS = self.determinizeParadigms
+            self.m.FUZZY_STEM_INDEX = self.fuzzyStemIndex
+            self.configure_parse_cache()
             self.m.fill_stems()
-            if self.parsingMethod == 'fst':
+            if self.parsingMethod in ('fst', 'suffix'):
                 self.m.fill_affixes()
 
+    def configure_parse_cache(self):
+        """
+        Set up the caches where the parser keeps the analyses
+        of the words it has already seen.
+        """
+        if self.m is None:
+            return
+        self.m.REMEMBER_PARSES = self.cacheParses
+        self.m.set_parse_cache(maxEntries=self.parseCacheSize,
+                               maxBytes=self.parseCacheBytes,
+                               policy=self.parseCachePolicy)
+        if self.grammarFingerprint is not None:
+            # Without the fingerprint, the stored analyses could not be trusted
+            self.m.set_disk_cache(self.analysisCacheFile, self.grammarFingerprint)
+
+    def parse_cache_stats(self):
+        """
+        Return a dictionary with the size of the parse cache
+        and the number of cache hits, misses and evictions.
+        """
+        if self.m is None:
+            return {}
+        return self.m.parseCache.stats()
+
+    def inflexion_cache_stats(self):
+        """
+        Return a dictionary with the size of the cache where the parser
+        keeps the inflexions found in word endings, and the number of
+        cache hits, misses and evictions.
+        """
+        if self.m is None:
+            return {}
+        return self.m.inflexionCache.stats()
+
+    def host_cache_stats(self):
+        """
+        Return a dictionary with the size of the cache where the parser
+        keeps the analyses of the words without clitics (hosts), and
+        the number of cache hits, misses and evictions.
+        """
+        if self.m is None:
+            return {}
+        return self.m.hostCache.stats()
+
+    def prune_analysis_cache(self):
+        """
+        Delete the analyses made with other versions of the grammar
+        from analysisCacheFile. Return the number of deleted entries.
+        """
+        if self.m is None or self.m.diskCache is None:
+            return 0
+        return self.m.diskCache.prune()
+
     def analyze_wordlist(self, freqListFile=None, parsedFile=None, unparsedFile=None,
-                         freqListSeparator=None, verbose=False, replacementsAllowed=0):
+                         freqListSeparator=None, verbose=False, replacementsAllowed=0,
+                         nWorkers=None):
         """
         Analyze a frequency list in a file. Write output to files with lists
         of analyzed and unanalyzed words. Use default filenames if none are
         specified as arguments. Return some statistics.
+        If nWorkers > 1, analyze the words in that many processes.
         """
         self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
         if freqListFile is None:
@@ -143,6 +299,8 @@ class Analyzer:
             unparsedFile = self.unparsedFile
         if freqListSeparator is None:
             freqListSeparator = self.freqListSeparator
+        if nWorkers is None:
+            nWorkers = self.nWorkers
 
         t1 = time.time()
         self.initialize_parser(verbose=verbose)
@@ -157,7 +315,9 @@ class Analyzer:
                                                     fnameUnparsed=unparsedFile,
                                                     glossing=self.glossing,
                                                     replacementsAllowed=replacementsAllowed,
-                                                    maxLines=10000000000)
+                                                    maxLines=10000000000,
+                                                    nWorkers=nWorkers,
+                                                    sortByFreq=self.sortFreqList)
         anaTime = time.time() - t1
         if verbose:
             print('Frequency list processed,', parsedRate * 100, '% tokens parsed.')
@@ -178,7 +338,8 @@ class Analyzer:
         property filled. Assume the parser has already been initialized.
         """
         self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
-        analyses = self.m.parse(word.lower(), replacementsAllowed=replacementsAllowed)
+        analyses = self.m.parse(word.lower(), replacementsAllowed=replacementsAllowed,
+                                glossing=self.glossing)
         if len(analyses) <= 0:
             analyses = [Wordform(self.g, wf=word)]
         else:
@@ -344,6 +505,8 @@ class Analyzer:
         Perform CG3 disambiguation if disambiguate == True and there is a CG3 file.
         """
         analyses = self.analyze_words_nodisamb(words, replacementsAllowed=replacementsAllowed)
+        if self.m.diskCache is not None:
+            self.m.diskCache.commit()
         if disambiguate and len(cgFile) > 0 and os.path.exists(cgFile):
             self.disambiguator.disambiguate_analyses(analyses, cgFile)
         if format == 'xml':
@@ -0,0 +1,162 @@
+class BadAnalysisIndex:
+    """
+    The templates from bad_analyses.txt (Grammar.badAnalyses and
+    Grammar.badAnalysesConditional) arranged so that a list of
+    analyses can be filtered in one pass.
+    Each unconditional template is stored under one of its fields
+    and the first character of the string that field has to start
+    with (e.g. wf="кулэ.*" goes under ('wf', 'к')), so only the
+    templates whose field matches the beginning of the analysis are
+    checked with regexes. The templates where no field has such
+    a string are checked for every analysis.
+    For the conditional templates, the analyses that match the
+    "if_exists" part are counted once per list, not once per analysis.
+    """
+    rxSpecialChars = set('.^$*+?{}[]\\|()')
+    rxQuantifiers = set('*+?{')
+
+    def __init__(self, badAnalyses, badAnalysesConditional):
+        self.badAnalyses = badAnalyses
+        self.badAnalysesConditional = badAnalysesConditional
+        self.nBadAnalyses = len(badAnalyses)
+        self.nBadAnalysesConditional = len(badAnalysesConditional)
+        self.templatesByStart = {}  # field -> {first character -> [(required start, template)]}
+        self.otherTemplates = []    # templates that cannot be indexed
+        for template in badAnalyses:
+            field, start = BadAnalysisIndex.index_key(template)
+            if field is None:
+                self.otherTemplates.append(template)
+                continue
+            if field not in self.templatesByStart:
+                self.templatesByStart[field] = {}
+            try:
+                self.templatesByStart[field][start[0]].append((start, template))
+            except KeyError:
+                self.templatesByStart[field][start[0]] = [(start, template)]
+
+    def is_built_from(self, g):
+        """
+        Check if the index contains the current templates of the grammar.
+        """
+        return (self.badAnalyses is g.badAnalyses
+                and self.badAnalysesConditional is g.badAnalysesConditional
+                and self.nBadAnalyses == len(g.badAnalyses)
+                and self.nBadAnalysesConditional == len(g.badAnalysesConditional))
+
+    @staticmethod
+    def required_start(pattern):
+        """
+        Return the string every match of the anchored regex must start
+        with (possibly empty).
+        """
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+        # An alternative outside of any group could start with anything
+        depth = 0
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == '\\':
+                i += 1
+            elif c == '[':
+                # Skip the character class
+                i += 1
+                if i < len(pattern) and pattern[i] == '^':
+                    i += 1
+                if i < len(pattern) and pattern[i] == ']':
+                    i += 1
+                while i < len(pattern) and pattern[i] != ']':
+                    if pattern[i] == '\\':
+                        i += 1
+                    i += 1
+            elif c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif c == '|' and depth <= 0:
+                return ''
+            i += 1
+        start = ''
+        for i in range(len(pattern)):
+            if pattern[i] in BadAnalysisIndex.rxSpecialChars:
+                if pattern[i] in BadAnalysisIndex.rxQuantifiers:
+                    # The last character is optional or repeated
+                    start = start[:-1]
+                break
+            start += pattern[i]
+        return start
+
+    @staticmethod
+    def index_key(template):
+        """
+        Choose the field of the template with the longest required
+        start. Return a tuple (field, start) or (None, '') if there
+        is no such field.
+        """
+        bestField, bestStart = None, ''
+        for field in sorted(template):
+            try:
+                start = BadAnalysisIndex.required_start(template[field].pattern)
+            except AttributeError:
+                continue
+            if len(start) > len(bestStart):
+                bestField, bestStart = field, start
+        return bestField, bestStart
+
+    @staticmethod
+    def analysis_conforms(ana, template):
+        """
+        Check if the analysis conforms to the template (the same as
+        Parser.analysis_conforms()).
+        """
+        for k, v in template.items():
+            try:
+                realValue = getattr(ana, k)
+                if v.search(realValue) is None:
+                    return False
+            except AttributeError:
+                return False
+        return True
+
+    def is_bad(self, ana):
+        """
+        Check if the analysis conforms to one of the unconditional
+        templates.
+        """
+        for field, templatesByChar in self.templatesByStart.items():
+            try:
+                value = getattr(ana, field)
+                templates = templatesByChar[value[0]]
+            except (AttributeError, KeyError, IndexError, TypeError):
+                continue
+            for start, template in templates:
+                if value.startswith(start) and BadAnalysisIndex.analysis_conforms(ana, template):
+                    return True
+        for template in self.otherTemplates:
+            if BadAnalysisIndex.analysis_conforms(ana, template):
+                return True
+        return False
+
+    def find_bad(self, analyses):
+        """
+        Return the list of booleans that says for each analysis in the
+        list whether it is bad. An analysis is bad if it conforms to
+        one of the unconditional templates, or to the "remove" part of
+        a conditional template while another analysis in the list
+        conforms to its "if_exists" part.
+        """
+        result = [self.is_bad(ana) for ana in analyses]
+        for badAna in self.badAnalysesConditional:
+            badAnaRemove = badAna['remove']
+            badAnaIfExists = badAna['if_exists']
+            anaExists = [BadAnalysisIndex.analysis_conforms(ana, badAnaIfExists)
+                         for ana in analyses]
+            nExist = sum(1 for bExists in anaExists if bExists)
+            if nExist <= 0:
+                continue
+            for i in range(len(analyses)):
+                if result[i] or nExist - anaExists[i] <= 0:
+                    continue
+                if BadAnalysisIndex.analysis_conforms(analyses[i], badAnaRemove):
+                    result[i] = True
+        return result
@@ -16,9 +16,9 @@ def check_for_regex(wf, rxTest, errorHandler=None):
         searchField = 'lemma'
     if searchField in Wordform.propertyFields:
         try:
-            if not rxTest.perform(wf.__dict__[searchField]):
+            if not rxTest.perform(getattr(wf, searchField)):
                 return False
-        except KeyError:
+        except AttributeError:
             return False
     else:
         testResults = [rxTest.perform(d[1])
@@ -60,7 +60,7 @@ def check_for_regex(item, rxTest, errorHandler=None, checkWordform=False):
         searchField = rxTest.field
         if searchField == 'lex':
             searchField = 'lemma'
-        if not rxTest.perform(item.__dict__[searchField]):
+        if not rxTest.perform(getattr(item, searchField)):
             return False
     else:
         if not checkWordform:
@@ -94,6 +94,64 @@ def replace_morph_breaks(gloss):
     return gloss
 
 
+def bounded_edit_distance(s1, s2, maxDistance):
+    """
+    Return the Damerau-Levenshtein distance between two strings
+    (optimal string alignment: substitutions, insertions, deletions
+    and swaps of adjacent characters) if it does not exceed
+    maxDistance, and maxDistance + 1 otherwise. Only the cells of the
+    DP matrix that lie at most maxDistance off the diagonal are
+    filled, and the computation stops as soon as a whole row
+    exceeds maxDistance.
+    """
+    tooFar = maxDistance + 1
+    if s1 == s2:
+        return 0
+    if abs(len(s1) - len(s2)) > maxDistance:
+        return tooFar
+    # Common prefixes and suffixes do not change the distance
+    start = 0
+    while start < len(s1) and start < len(s2) and s1[start] == s2[start]:
+        start += 1
+    if start > 0:
+        # Keep one character for a possible swap
+        start -= 1
+    end1, end2 = len(s1), len(s2)
+    while end1 > start and end2 > start and s1[end1 - 1] == s2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    if end1 < len(s1):
+        end1 += 1
+        end2 += 1
+    s1, s2 = s1[start:end1], s2[start:end2]
+    len1, len2 = len(s1), len(s2)
+    prevPrevRow = None
+    prevRow = [j if j <= maxDistance else tooFar for j in range(len2 + 1)]
+    for i in range(1, len1 + 1):
+        curRow = [tooFar] * (len2 + 1)
+        if i <= maxDistance:
+            curRow[0] = i
+        rowMin = curRow[0]
+        c1 = s1[i - 1]
+        for j in range(max(1, i - maxDistance), min(len2, i + maxDistance) + 1):
+            c2 = s2[j - 1]
+            if c1 == c2:
+                d = prevRow[j - 1]
+            else:
+                d = min(prevRow[j - 1], prevRow[j], curRow[j - 1]) + 1
+                if i > 1 and j > 1 and c1 == s2[j - 2] and s1[i - 2] == c2:
+                    d = min(d, prevPrevRow[j - 2] + 1)
+            if d > tooFar:
+                d = tooFar
+            curRow[j] = d
+            if d < rowMin:
+                rowMin = d
+        if rowMin > maxDistance:
+            return tooFar
+        prevPrevRow, prevRow = prevRow, curRow
+    return prevRow[len2]
+
+
 rxCleanL = re.compile('([>~\\-=])-+')
 rxCleanLDoubleEq = re.compile('([>~=])=+')
 rxCleanR = re.compile('-+([<~=]|$)')
@@ -0,0 +1,190 @@
+import os
+import json
+import sqlite3
+import hashlib
+from .wordform import Wordform
+
+
+class DiskAnalysisCache:
+    """
+    Analyses of tokens stored in an SQLite database, so that they
+    can be reused by later runs with the same grammar. The entries
+    are keyed by the grammar fingerprint, the token, the
+    replacementsAllowed value and the glossing flag. If the analyses
+    with replacements depend on parser settings that are not part of
+    the grammar fingerprint, these settings are added to it.
+    The analyses made with other versions of the grammar stay in the
+    file (several grammars can share one file) until prune() is called.
+    Several processes can read from and write to the same file.
+    """
+    TIMEOUT = 60                # seconds to wait for a lock held by another process
+    COMMIT_EVERY = 1000         # number of new entries after which they are written to the file
+    FORMAT_VERSION = 2          # increase whenever the way analyses are stored changes
+    wfFields = ('wf', 'wfGlossed', 'wfGlossedStd', 'gloss', 'lemma', 'gramm', 'stem')
+    glossFields = ('wfGlossed', 'wfGlossedStd', 'gloss')
+
+    def __init__(self, fname, fingerprint):
+        self.fname = fname
+        self.fingerprint = fingerprint + '-' + str(self.FORMAT_VERSION)
+        self.conn = None
+        self.pid = None
+        self.parentConns = []   # connections inherited from parent processes, never used or closed
+        self.settingsFingerprints = {}  # settings -> fingerprint with these settings
+        self.pending = []       # new entries not written yet
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['conn'] = None     # connections cannot be pickled
+        state['pid'] = None
+        state['parentConns'] = []
+        state['pending'] = []
+        return state
+
+    def connect(self):
+        """
+        Return the connection for the current process. A process
+        created with fork() must not use the connection of its parent,
+        so a new one is opened. The inherited connection is kept
+        in self.parentConns, because it would be closed if it were
+        garbage-collected in the child process.
+        """
+        if self.conn is not None and self.pid == os.getpid():
+            return self.conn
+        if self.conn is not None:
+            self.parentConns.append(self.conn)
+        self.conn = sqlite3.connect(self.fname, timeout=self.TIMEOUT)
+        self.pid = os.getpid()
+        self.pending = []       # entries of the parent process are written by the parent
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS analyses '
+                          '(fingerprint TEXT, token TEXT, replacements INTEGER, '
+                          'glossing INTEGER, data TEXT, '
+                          'PRIMARY KEY (fingerprint, token, replacements, glossing)) '
+                          'WITHOUT ROWID')
+        return self.conn
+
+    def prune(self):
+        """
+        Delete the analyses made with other versions of the grammar.
+        Return the number of deleted entries.
+        """
+        self.commit()
+        conn = self.connect()
+        with conn:
+            cur = conn.execute('DELETE FROM analyses WHERE fingerprint<>? '
+                               'AND substr(fingerprint, 1, ?)<>?',
+                               (self.fingerprint, len(self.fingerprint) + 1,
+                                self.fingerprint + ':'))
+        return cur.rowcount
+
+    def settings_fingerprint(self, settings):
+        """
+        Return the fingerprint under which the analyses made with
+        the parser settings (a tuple of strings and numbers, or None
+        if the analyses do not depend on any settings) are stored.
+        """
+        if settings is None:
+            return self.fingerprint
+        try:
+            return self.settingsFingerprints[settings]
+        except KeyError:
+            pass
+        fingerprint = self.fingerprint + ':' + hashlib.sha1(
+            json.dumps(settings, ensure_ascii=False).encode('utf-8')).hexdigest()
+        self.settingsFingerprints[settings] = fingerprint
+        return fingerprint
+
+    @staticmethod
+    def wordform2dict(wf, glossing=True):
+        d = {}
+        for field in DiskAnalysisCache.wfFields:
+            if not glossing and field in DiskAnalysisCache.glossFields:
+                continue
+            # Empty strings are kept: the fields of a restored
+            # Wordform must be the same as in the original one
+            d[field] = getattr(wf, field)
+        if len(wf.otherData) > 0:
+            d['otherData'] = wf.otherData
+        if len(wf.subwords) > 0:
+            d['subwords'] = [DiskAnalysisCache.wordform2dict(swf, glossing=glossing)
+                             for swf in wf.subwords]
+        return d
+
+    @staticmethod
+    def dict2wordform(g, d):
+        wf = Wordform(g, wf=d.get('wf'))
+        for field in DiskAnalysisCache.wfFields:
+            if field != 'wf' and field in d:
+                setattr(wf, field, d[field])
+        if 'otherData' in d:
+            wf.otherData = [tuple(kv) for kv in d['otherData']]
+        if 'subwords' in d:
+            wf.subwords = [DiskAnalysisCache.dict2wordform(g, swd) for swd in d['subwords']]
+        return wf
+
+    def get(self, g, token, replacementsAllowed=0, glossing=True, settings=None):
+        """
+        Return a list of Wordform objects stored for the token, or None
+        if the token has not been analyzed yet.
+        """
+        conn = self.connect()
+        row = conn.execute('SELECT data FROM analyses WHERE fingerprint=? AND token=? '
+                           'AND replacements=? AND glossing=?',
+                           (self.settings_fingerprint(settings), token, replacementsAllowed,
+                            int(glossing))).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [DiskAnalysisCache.dict2wordform(g, d) for d in json.loads(row[0])]
+
+    def put(self, token, analyses, replacementsAllowed=0, glossing=True, settings=None):
+        """
+        Store the analyses (list of Wordform objects) of the token.
+        The new entries are written in batches, so that the file
+        is only locked for writing for a short time.
+        """
+        data = json.dumps([DiskAnalysisCache.wordform2dict(wf, glossing=glossing)
+                           for wf in analyses],
+                          ensure_ascii=False)
+        self.pending.append((self.settings_fingerprint(settings), token, replacementsAllowed, int(glossing), data))
+        if len(self.pending) >= self.COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """
+        Write the new entries to the file.
+        """
+        if len(self.pending) <= 0:
+            return
+        conn = self.connect()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO analyses '
+                             '(fingerprint, token, replacements, glossing, data) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             self.pending)
+        self.pending = []
+
+    def close(self):
+        self.commit()
+        if self.conn is not None:
+            if self.pid == os.getpid():
+                self.conn.close()
+            else:
+                self.parentConns.append(self.conn)
+        self.conn = None
+        self.pid = None
+
+    def stats(self):
+        nRequests = self.hits + self.misses
+        hitRate = 0.0
+        if nRequests > 0:
+            hitRate = self.hits / nRequests
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': hitRate
+        }
@@ -0,0 +1,84 @@
+class FuzzyStemLookup:
+    """
+    Search for stems in a token with a limited number of replacements
+    (substitutions, insertions, deletions and swaps of adjacent characters).
+    The search is the same depth-first search as in MorphFST.transduce()
+    (through the tuples (position in the token, FST state, stem
+    boundaries, replacements left, replacements made), where each
+    step either reads the next character or makes a replacement),
+    with two differences. First, identical results are returned once,
+    even if several paths lead to them; the same stem found with
+    different sequences of replacements still counts as different
+    results. Second, the number of search steps for one token is
+    limited by maxSteps. If the limit is reached, only the stems found
+    so far are returned, the error is reported to the error handler
+    and counted in stats().
+    (Remembering the results for each (position, state, boundaries,
+    replacements left) tuple was tried, but few of them are reached
+    twice, and keeping track of them made the search slower.)
+    """
+    MAX_STEPS = 200000
+
+    def __init__(self, fst, maxSteps=None, verbose=0, errorHandler=None):
+        self.fst = fst
+        self.maxSteps = maxSteps
+        if self.maxSteps is None:
+            self.maxSteps = self.MAX_STEPS
+        self.verbose = verbose
+        self.errorHandler = errorHandler
+        if self.errorHandler is None and self.fst.g is not None:
+            self.errorHandler = self.fst.g.errorHandler
+        self.nLookups = 0
+        self.nBudgetExceeded = 0
+
+    def raise_error(self, message, data=None):
+        if self.errorHandler is not None:
+            self.errorHandler.raise_error(message, data)
+
+    def lookup(self, token, replacementsAllowed=1):
+        """
+        Return the list of stems found in the token with at most
+        replacementsAllowed replacements.
+        """
+        fst = self.fst
+        if not fst.finalized:
+            fst.finalize()
+        self.nLookups += 1
+        result = []
+        resultKeys = set()
+        lastChar = len(token) - 1
+        nSteps = 0
+        add_next_items = fst.add_next_items
+        stack = [(token, 0, fst.startState, 0, lastChar, max(0, replacementsAllowed), ())]
+        while len(stack) > 0:
+            curToken, i, curState, objStart, objEnd, replLeft, repls = stack.pop()
+            if objEnd == -1 or objEnd > lastChar:
+                objEnd = lastChar
+            if i > lastChar:
+                objects = fst.get_objects(curState)
+                if objects is not None:
+                    for obj in objects:
+                        resultKey = (objStart, objEnd, id(obj), repls)
+                        if resultKey not in resultKeys:
+                            resultKeys.add(resultKey)
+                            result.append((objStart, objEnd, obj, repls))
+                continue
+            nSteps += 1
+            if nSteps > self.maxSteps:
+                self.nBudgetExceeded += 1
+                self.raise_error('Fuzzy search for ' + token + ' stopped after ' +
+                                 str(self.maxSteps) + ' steps, some analyses may be missing.')
+                if self.verbose > 0:
+                    print('Fuzzy search for', token, 'stopped after', self.maxSteps, 'steps.')
+                break
+            nextItems = []
+            add_next_items(nextItems, curToken, i, curState, objStart, objEnd, replLeft, repls)
+            nextItems.reverse()
+            stack += nextItems
+        return result
+
+    def stats(self):
+        return {
+            'lookups': self.nLookups,
+            'budget_exceeded': self.nBudgetExceeded
+        }
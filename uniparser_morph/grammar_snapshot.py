@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+import sys
+from .morph_fst import MorphFSTState
+
+SNAPSHOT_VERSION = 15    # increase whenever the pickled structures change
+
+
+def grammar_fingerprint(fileGroups, options):
+    """
+    Return a string that identifies a particular version of the
+    grammar. fileGroups is a dictionary {file type -> list of filenames},
+    options is a dictionary with compilation options. The fingerprint
+    changes if any of the files or options change.
+    """
+    h = hashlib.sha1()
+    h.update(('uniparser-snapshot-' + str(SNAPSHOT_VERSION)).encode('utf-8'))
+    for fileType in sorted(fileGroups):
+        h.update(('\n#' + fileType).encode('utf-8'))
+        for fname in sorted(fileGroups[fileType]):
+            h.update(('\n' + os.path.basename(fname) + '\n').encode('utf-8'))
+            try:
+                with open(fname, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        h.update(block)
+            except IOError:
+                h.update(b'<missing>')
+    for k in sorted(options):
+        h.update(('\n' + k + '=' + str(options[k])).encode('utf-8'))
+    return h.hexdigest()
+
+
+def save_snapshot(fname, fingerprint, g, m):
+    """
+    Save the compiled Grammar g together with the initialized
+    Parser m to the file fname. The file contains two pickled
+    objects: a small header with the version and the fingerprint,
+    which can be checked without loading the rest, and the grammar
+    with the parser. The file is written under a temporary
+    name first, so that the processes which read the snapshot
+    never see a half-written file.
+    """
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'fingerprint': fingerprint,
+        'lastStateID': MorphFSTState.lastID
+    }
+    data = {
+        'grammar': g,
+        'parser': m
+    }
+    tmpFname = fname + '.' + str(os.getpid()) + '.tmp'
+    recursionLimit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursionLimit, 20000))
+    try:
+        with open(tmpFname, 'wb') as fOut:
+            pickle.dump(header, fOut, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, fOut, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpFname, fname)
+    finally:
+        sys.setrecursionlimit(recursionLimit)
+        if os.path.exists(tmpFname):
+            os.remove(tmpFname)
+
+
+def load_snapshot(fname, fingerprint):
+    """
+    Load the compiled grammar and the parser from the file fname.
+    Return a tuple (Grammar, Parser) or None if there is no such
+    file, it cannot be read, or it was made from a different version
+    of the grammar. In the latter case, only the header is read.
+    """
+    if not os.path.exists(fname):
+        return None
+    recursionLimit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursionLimit, 20000))
+    try:
+        with open(fname, 'rb') as fIn:
+            header = pickle.load(fIn)
+            if (type(header) != dict
+                    or header.get('version') != SNAPSHOT_VERSION
+                    or header.get('fingerprint') != fingerprint):
+                return None
+            data = pickle.load(fIn)
+    except Exception:
+        return None
+    finally:
+        sys.setrecursionlimit(recursionLimit)
+    if type(data) != dict or 'grammar' not in data or 'parser' not in data:
+        return None
+    # New FST states must not get the ids of the states that were loaded
+    MorphFSTState.lastID = max(MorphFSTState.lastID, header['lastStateID'])
+    return data['grammar'], data['parser']
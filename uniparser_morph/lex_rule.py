@@ -1,6 +1,6 @@
 import copy
 from .reduplication import RegexTest
-from .common_functions import check_for_regex
+from .common_functions import wfPropertyFields
 
 
 class LexRule:
@@ -21,6 +21,7 @@ class LexRule:
         self.lemma = None
         self.searchFields = []
         self.addFields = []
+        self.searchChecks = []  # tuples (field, whether it is in otherData, compiled regex search method)
         for obj in dictRule['content']:
             if obj['name'] == 'search':
                 self.process_search(obj['content'])
@@ -29,22 +30,87 @@ class LexRule:
             else:
                 self.raise_error('Unrecognized field in a lexical rule description: ',
                                  obj)
+        self.compile_search()
 
     def raise_error(self, message, data=None):
         if self.errorHandler is not None:
             self.errorHandler.RaiseError(message, data)
 
-    def apply(self, wf):
-        if wf.stem != self.stem and wf.lemma != self.lemma:
-            return None
+    def compile_search(self):
+        """
+        Turn the regex tests of the rule into a list of checks
+        that matches() can perform without looking up the fields
+        (the same tests as check_for_regex() makes for a Wordform).
+        If the rule can never be applied, set searchChecks to None.
+        """
+        self.searchChecks = []
         for rxTest in self.searchFields:
-            if not check_for_regex(wf, rxTest, errorHandler=self.errorHandler,
-                                   checkWordform=True):
-                return None
-        wfNew = copy.deepcopy(wf)
-        wfNew.otherData += self.addFields
+            field = rxTest.field
+            if field == 'prev':
+                field = 'stem'
+            if field == 'paradigm':
+                if self.errorHandler is not None:
+                    self.errorHandler.raise_error('Paradigm names cannot be subject to '
+                                                  'regex tests.')
+                self.searchChecks = None
+                return
+            self.searchChecks.append((field, field != 'stem' and field not in wfPropertyFields,
+                                      rxTest.rxTest.search))
+
+    @staticmethod
+    def other_values(wf):
+        """
+        Return a dictionary field -> [values] for the otherData
+        of the Wordform.
+        """
+        otherValues = {}
+        for k, v in wf.otherData:
+            try:
+                otherValues[k].append(v)
+            except KeyError:
+                otherValues[k] = [v]
+        return otherValues
+
+    def matches(self, wf, otherValues=None):
+        """
+        Check if the Wordform passes all the regex tests of the rule.
+        otherValues is the result of other_values() for the Wordform,
+        if it has already been computed for other rules.
+        """
+        if self.searchChecks is None:
+            return False
+        for field, bOtherData, search in self.searchChecks:
+            if not bOtherData:
+                if search(getattr(wf, field)) is None:
+                    return False
+                continue
+            if otherValues is None:
+                otherValues = LexRule.other_values(wf)
+            if field not in otherValues:
+                return False
+            for value in otherValues[field]:
+                if search(value) is None:
+                    return False
+        return True
+
+    def add_fields(self, wf):
+        """
+        Return a copy of the Wordform with the fields of the rule
+        added. The copy shares everything except the lists with the
+        original, so both can be changed independently later.
+        """
+        wfNew = copy.copy(wf)
+        wfNew.otherData = wf.otherData + self.addFields
+        wfNew.subwords = list(wf.subwords)
         return wfNew
 
+    def apply(self, wf, otherValues=None):
+        if wf.stem != self.stem and wf.lemma != self.lemma:
+            return None
+        if not self.matches(wf, otherValues):
+            return None
+        return self.add_fields(wf)
+
     def process_search(self, dictRules):
         for rule in dictRules:
             field = rule['name']
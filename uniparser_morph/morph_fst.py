@@ -1,4 +1,6 @@
 import re
+from array import array
+from bisect import bisect_left
 
 
 class MorphFSTState:
@@ -15,6 +17,7 @@ class MorphFSTState:
         if obj is not None:
             self.obj = [obj]
         self.loopState = loopState
+        self.closurePlan = None     # set by MorphFST.finalize() if the state has empty arcs
         self.id = MorphFSTState.lastID + 1
         MorphFSTState.lastID += 1
 
@@ -69,6 +72,12 @@ class MorphFST:
     rxMultipleDots = re.compile('(?:\\[\\.\\]|\\.){2,}')
     rxAfxLeadingDot = re.compile('^(?:<[0-9,]*>)?\\.(?![0.\\[|¦])')
 
+    # Steps of a closure plan (see finalize()); None stands for the state itself
+    PLAN_ARCS = 0
+    PLAN_LOOP = 1
+    simplePlan = ((PLAN_ARCS, None, False),)
+    simpleLoopPlan = ((PLAN_ARCS, None, False), (PLAN_LOOP, None, False))
+
     def __init__(self, g, verbose=0, det=False):
         self.g = g
         self.transitions = {}
@@ -76,6 +85,7 @@ class MorphFST:
         self.startState = MorphFSTState()
         self.verbose = verbose
         self.det = det
+        self.finalized = False
 
     def prepare_stem(self, stem):
         """
@@ -114,6 +124,13 @@ class MorphFST:
         # print(afx)
         return afx
 
+    def get_objects(self, curState):
+        """
+        Return the list of objects the transducer writes as its
+        output if it stops in curState, or None.
+        """
+        return curState.obj
+
     def get_next_states_strict(self, curState, curChar):
         try:
             return list(self.transitions[(curState, curChar)])
@@ -121,18 +138,20 @@ class MorphFST:
             return []
 
     def get_next_states(self, curState, curChar):
-        try:
-            resultStrict = self.transitions[(curState, curChar)]
-        except KeyError:
-            resultStrict = set()
-        resultNonstrict = set()
-        resultLoop = set()
+        """
+        Return the collections of states reachable from curState with
+        curChar: by a transition for that character, by an empty
+        transition, and by a loop. The collections should not be modified.
+        """
+        resultStrict = self.transitions.get((curState, curChar), ())
+        resultNonstrict = ()
+        resultLoop = ()
         if curState.loopState:
             if not self.det or len(resultStrict) <= 0:
-                resultLoop.add(curState)
-        if not self.det and (curState, '') in self.transitions:
-            resultNonstrict |= self.transitions[(curState, '')]
-        return list(resultStrict), list(resultNonstrict), list(resultLoop)
+                resultLoop = (curState,)
+        if not self.det:
+            resultNonstrict = self.transitions.get((curState, ''), ())
+        return resultStrict, resultNonstrict, resultLoop
 
     def get_next_states_with_replacement(self, curState, curChar):
         if curState not in self.transitionsByState:
@@ -143,11 +162,70 @@ class MorphFST:
         except KeyError:
             resultStrictSub = self.transitionsByState[curState]
         if (curState, '') in self.transitions:
-            resultStrictSub -= self.transitions[(curState, '')]
+            # Do not use -=, which would change the transitions of the state
+            resultStrictSub = resultStrictSub - self.transitions[(curState, '')]
         resultStrictDel = self.transitionsByState[curState]
         return list(resultStrictSub), list(resultStrictDel)
 
+    def get_arc_targets(self, curState, curChar):
+        """
+        Return the collection of states reachable from curState
+        by a transition for curChar. It should not be modified.
+        """
+        return self.transitions.get((curState, curChar), ())
+
+    def get_closure_plan(self, curState):
+        """
+        Return the closure plan of the state built by finalize().
+        """
+        if curState.closurePlan is not None:
+            return curState.closurePlan
+        if curState.loopState:
+            return MorphFST.simpleLoopPlan
+        return MorphFST.simplePlan
+
+    def make_closure_plan(self, curState, viaEmpty=False, path=None):
+        """
+        Return a list of steps transduce() makes from curState, in the
+        order in which it would make them following the empty arcs one
+        by one: first the arcs of curState itself, then everything
+        reachable through each of its empty arcs, then its loop.
+        Each step is a tuple (PLAN_ARCS or PLAN_LOOP, state, viaEmpty),
+        where viaEmpty says whether the state was reached by empty arcs.
+        """
+        if path is None:
+            path = set()
+        plan = [(MorphFST.PLAN_ARCS, curState, viaEmpty)]
+        if not self.det:
+            path.add(curState)
+            for stTo in self.transitions.get((curState, ''), ()):
+                if stTo not in path:
+                    plan += self.make_closure_plan(stTo, viaEmpty=True, path=path)
+            path.discard(curState)
+        if curState.loopState:
+            plan.append((MorphFST.PLAN_LOOP, curState, viaEmpty))
+        return plan
+
+    def finalize(self):
+        """
+        Precompute the closure plans of all states with empty arcs, so that
+        transduce() does not have to follow the empty arcs one by one.
+        This is done automatically before the first transduce(); any new
+        transition makes the FST non-finalized again.
+        """
+        for st in self.get_all_states():
+            st.closurePlan = None
+            if not self.det and (st, '') in self.transitions:
+                plan = self.make_closure_plan(st)
+                # the state itself is the first step
+                st.closurePlan = tuple([(MorphFST.PLAN_ARCS, None, False)] +
+                                       plan[1:])
+                if st.loopState:
+                    st.closurePlan = st.closurePlan[:-1] + ((MorphFST.PLAN_LOOP, None, False),)
+        self.finalized = True
+
     def add_transition(self, curState, curChar, nextState):
+        self.finalized = False
         try:
             self.transitions[(curState, curChar)].add(nextState)
         except KeyError:
@@ -225,86 +303,122 @@ class MorphFST:
         if self.verbose > 0:
             print('inflexion:', infl.flex, ';', statesAdded, 'states added.')
 
-    def get_reachable_states(self, states, usedStates=None):
+    def get_all_states(self):
         """
-        Find all states reachable from the given state by empty arcs.
+        Return the list of all states, starting with the start state.
         """
-        if usedStates is None:
-            usedStates = set(st for st in states)
-        reachableStates = set()
+        states = {self.startState}
         for st, c in self.transitions:
-            if c == '' and st in states:
-                for stTo in self.transitions[(st, c)]:
-                    if stTo not in usedStates:
-                        reachableStates.add(stTo)
-        if len(reachableStates) <= 0:
-            return states
-        result = states | reachableStates
-        result |= self.get_reachable_states(reachableStates,
-                                            usedStates | reachableStates)
+            states.add(st)
+            states |= self.transitions[(st, c)]
+        states.discard(self.startState)
+        return [self.startState] + sorted(states)
+
+    def n_states(self):
+        return len(self.get_all_states())
+
+    def get_reachable_states(self, state):
+        """
+        Find all states reachable from the given state by empty arcs
+        (including the state itself).
+        """
+        result = {state}
+        statesToCheck = [state]
+        while len(statesToCheck) > 0:
+            st = statesToCheck.pop()
+            for stTo in self.transitions.get((st, ''), ()):
+                if stTo not in result:
+                    result.add(stTo)
+                    statesToCheck.append(stTo)
         return result
 
-    def det_follow_transitions(self, detFst, curStates, curStateDet, usedIds):
+    def determinize(self, maxStates=None, minimize=True):
         """
-        Add new states and transitions to the determinized FST,
-        starting from the states corresponding to curStateDet.
-        Return the number of states added to the determinized FST.
+        Return a DeterministicMorphFST that accepts the same strings
+        and writes the same objects as self, or None if it would have
+        more than maxStates states.
+        Each state of the deterministic FST corresponds to a set of
+        states of self where the transducer can get after reading
+        some characters. Loop states, which accept any character, turn
+        into a default transition, which is followed if there is no
+        transition for the current character.
+        Note that transduce() only outputs the objects of the states
+        where it ends up after reading the last character and does
+        not follow empty arcs after that.
         """
-        if curStateDet.id in usedIds:
-            return 0
-        usedIds.add(curStateDet.id)
-        statesAdded = 0
-        dictReachableStates = {}    # character -> {old states}
+        if self.verbose > 0:
+            print('Determinizing the FST...')
+        arcsByState = {}     # state -> {character -> {states}}, no empty arcs
         for st, c in self.transitions:
-            if c != '' and st.id in curStateDet.id:
+            if len(c) > 0:
                 try:
-                    dictReachableStates[c] |= set(self.transitions[(st, c)])
+                    arcsByState[st][c] = self.transitions[(st, c)]
                 except KeyError:
-                    dictReachableStates[c] = set(self.transitions[(st, c)])
-        for c in dictReachableStates:
-            newStateDet = MorphFSTState()
-            statesAdded += 1
-            if curStateDet.loopState:
-                dictReachableStates[c] |= curStates
-            dictReachableStates[c] = self.get_reachable_states(dictReachableStates[c])
-            if any(st.loopState for st in dictReachableStates[c]):
-                newStateDet.loopState = True
-            ids = [st.id for st in dictReachableStates[c]]
-            # if curStateDet.loopState:
-            #     ids += list(curStateDet.id)
-            newStateDet.id = tuple(i for i in sorted(set(ids)))
-            for st in dictReachableStates[c]:
-                if st.obj is not None:
-                    for o in st.obj:
-                        newStateDet.add_obj(o)
-            detFst.transitions[(curStateDet, c)] = [newStateDet]
-            statesAdded += self.det_follow_transitions(detFst, dictReachableStates[c],
-                                                       newStateDet, usedIds)
-        return statesAdded
+                    arcsByState[st] = {c: self.transitions[(st, c)]}
+        closures = {}
+        detFst = DeterministicMorphFST(self)
+        startSet = frozenset([self.startState])
+        stateIdx = {startSet: 0}
+        stateSets = [startSet]
+        detFst.add_state(self.get_set_objects(startSet))
+        iState = 0
+        while iState < len(stateSets):
+            curSet = stateSets[iState]
+            reachableStates = set()
+            for st in curSet:
+                if st not in closures:
+                    closures[st] = self.get_reachable_states(st)
+                reachableStates |= closures[st]
+            loopStates = frozenset(st for st in reachableStates if st.loopState)
+            nextSets = {}
+            for st in reachableStates:
+                if st in arcsByState:
+                    for c in arcsByState[st]:
+                        try:
+                            nextSets[c] |= arcsByState[st][c]
+                        except KeyError:
+                            nextSets[c] = loopStates | arcsByState[st][c]
+            nextSets[None] = loopStates     # default transition
+            for c in sorted(nextSets, key=lambda x: '' if x is None else x):
+                nextSet = frozenset(nextSets[c])
+                if len(nextSet) <= 0:
+                    continue
+                if nextSet not in stateIdx:
+                    if maxStates is not None and len(stateSets) >= maxStates:
+                        if self.verbose > 0:
+                            print('Determinization stopped: more than', maxStates, 'states.')
+                        return None
+                    stateIdx[nextSet] = len(stateSets)
+                    stateSets.append(nextSet)
+                    detFst.add_state(self.get_set_objects(nextSet))
+                if c is None:
+                    detFst.defaults[iState] = stateIdx[nextSet]
+                else:
+                    detFst.arcs[iState][c] = stateIdx[nextSet]
+            iState += 1
+        if self.verbose > 0:
+            print('Finished determinizing:', len(stateSets), 'states in the new FST.')
+        if minimize:
+            detFst = detFst.minimize()
+            if self.verbose > 0:
+                print('Minimized:', detFst.nStates, 'states in the new FST.')
+        return detFst
 
-    def determinize(self):
+    @staticmethod
+    def get_set_objects(states):
         """
-        Return a determinized version of self. Note that the
-        number of states may grow exponentially and there is
-        no minimization.
+        Return a tuple with all objects written by the given states,
+        or None if there are none.
         """
-        if self.verbose > 0:
-            print('Determinizing the FST...')
-        detFst = MorphFST(verbose=self.verbose, det=True)
-        seedState = {self.startState}
-        startStates = self.get_reachable_states(seedState)
-        detFst.startState.id = tuple(st.id for st in sorted(set(startStates)))
-        if any(st.loopState for st in startStates):
-            detFst.startState.loopState = True
-        for st in startStates:
+        objects = []
+        for st in sorted(states):
             if st.obj is not None:
-                for o in st.obj:
-                    detFst.startState.add_obj(o)
-        statesAdded = 1 + self.det_follow_transitions(detFst, startStates,
-                                                      detFst.startState, set())
-        if self.verbose > 0:
-            print('Finished determinizing:', statesAdded, 'states in the new FST.')
-        return detFst
+                for obj in st.obj:
+                    if all(obj is not o for o in objects):
+                        objects.append(obj)
+        if len(objects) <= 0:
+            return None
+        return tuple(objects)
 
     def transduce(self, token, startChar=0, startState=None,
                   objStart=0, objEnd=-1,
@@ -312,80 +426,80 @@ class MorphFST:
         """
         Return all objects the transducer can write as its output
         when given token as its input.
+        Each object comes in a tuple (objStart, objEnd, obj, replacements),
+        where replacements is a tuple of replacements the token needs
+        to undergo to be accepted by the transducer.
+        The paths are explored depth-first with an explicit stack
+        (not with recursion), in the same order as they would be explored
+        by a recursive search, so the order of the results is stable.
         """
         result = []
-        if objEnd == -1 or objEnd > len(token) - 1:
-            objEnd = len(token) - 1
+        if not self.finalized:
+            self.finalize()
+        lastChar = len(token) - 1
         if replacementsAllowed < 0:
             replacementsAllowed = 0
-        curState = startState
-        if curState is None:
-            curState = self.startState
-        i = startChar
-        if i <= len(token) - 1:
-            if replacementsAllowed > 0:
-                nextStStrictSub, nextStStrictDel = self.get_next_states_with_replacement(curState, token[i])
-
-                # Substitution
-                for st in nextStStrictSub:
-                    curObjEnd = objEnd
-                    if curObjEnd >= i:
-                        curObjEnd = i + 1
-                    for res in self.transduce(token, i + 1, st, objStart, curObjEnd,
-                                              replacementsAllowed=replacementsAllowed - 1):
-                        result.append(tuple([res[0], res[1], res[2], tuple([('sub', i)] + list(res[3]))]))
-                # Deletion (followed a transition without chopping any character)
-                curObjEnd = objEnd
-                if curObjEnd >= i - 1:
-                    curObjEnd = i
-                for st in nextStStrictDel:
-                    for res in self.transduce(token, i, st, objStart, curObjEnd,
-                                              replacementsAllowed=replacementsAllowed - 1):
-                        result.append(tuple([res[0], res[1], res[2], tuple([('ins', i)] + list(res[3]))]))
-                # Insertion (did not follow any transition while chopping one character)
-                # Do not apply to the first or the last character of the word
-                if 0 < i < len(token) - 1:
-                    curObjEnd = objEnd
+        if startState is None:
+            startState = self.startState
+        add_next_items = self.add_next_items
+        # Each item is a tuple (token, current character, current state,
+        # objStart, objEnd, number of replacements allowed, replacements made)
+        stack = [(token, startChar, startState, objStart, objEnd, replacementsAllowed, ())]
+        while len(stack) > 0:
+            token, i, curState, objStart, objEnd, replacementsAllowed, repls = stack.pop()
+            if objEnd == -1 or objEnd > lastChar:
+                objEnd = lastChar
+            if i > lastChar:
+                objects = self.get_objects(curState)
+                if objects is not None:
+                    result += [(objStart, objEnd, obj, repls) for obj in objects]
+                continue
+            nextItems = []
+            add_next_items(nextItems, token, i, curState, objStart, objEnd,
+                           replacementsAllowed, repls)
+            # The first item must be taken from the stack first, which
+            # gives the same order as a recursive search
+            nextItems.reverse()
+            stack += nextItems
+        return result
+
+    def add_next_items(self, nextItems, token, i, curState, objStart, objEnd,
+                       replacementsAllowed, repls):
+        """
+        Add all search items that follow the given one after reading
+        the character i (i < len(token)) to nextItems.
+        """
+        lastChar = len(token) - 1
+        # objEnd for the states reached by empty arcs
+        emptyObjEnd = objEnd
+        if emptyObjEnd >= i:
+            emptyObjEnd = i - 1
+            if emptyObjEnd == -1:
+                emptyObjEnd = lastChar
+        c = token[i]
+        for step, st, viaEmpty in self.get_closure_plan(curState):
+            if st is None:
+                st = curState
+            stObjEnd = objEnd
+            if viaEmpty:
+                stObjEnd = emptyObjEnd
+            if step == MorphFST.PLAN_ARCS:
+                if replacementsAllowed > 0:
+                    self.add_replacement_items(nextItems, token, i, st, objStart, stObjEnd,
+                                               replacementsAllowed, repls)
+                # No replacements
+                nextStStrict = self.get_arc_targets(st, c)
+                if len(nextStStrict) > 0:
+                    curObjEnd = stObjEnd
                     if curObjEnd >= i:
                         curObjEnd = i + 1
-                    curRepl = ('del', i)
-                    for res in self.transduce(token, i + 1, curState, objStart, curObjEnd,
-                                              replacementsAllowed=replacementsAllowed - 1):
-                        result.append(tuple([res[0], res[1], res[2], tuple([curRepl] + list(res[3]))]))
-
-                # Character swap
-                if i < len(token) - 1 and token[i] != token[i+1]:
-                    curRepl = ('swap', i)
-                    tokenSwap = token[:i] + token[i+1] + token[i] + token[i+2:]
-                    nextStStrictSwap, nextStNonstrictSwap, nextStLoopSwap = self.get_next_states(curState, tokenSwap[i])
-                    for st in nextStStrictSwap:
-                        curObjEnd = objEnd
-                        if curObjEnd >= i:
-                            curObjEnd = i + 1
-                        for res in self.transduce(tokenSwap, i + 1, st, objStart, curObjEnd,
-                                                  replacementsAllowed=replacementsAllowed - 1):
-                            result.append(tuple([res[0], res[1], res[2], tuple([curRepl] + list(res[3]))]))
-
-            # No replacements
-            nextStStrict, nextStNonstrict, nextStLoop = self.get_next_states(curState, token[i])
-            if len(nextStStrict) <= 0 and len(nextStNonstrict) <= 0\
-                    and len(nextStLoop) <= 0:
-                return result
-            for st in nextStStrict:
-                curObjEnd = objEnd
-                if curObjEnd >= i:
-                    curObjEnd = i + 1
-                result += self.transduce(token, i + 1, st, objStart, curObjEnd,
-                                         replacementsAllowed=replacementsAllowed)
-            for st in nextStNonstrict:
-                curObjEnd = objEnd
-                if curObjEnd >= i:
-                    curObjEnd = i - 1
-                result += self.transduce(token, i, st, objStart, curObjEnd,
-                                         replacementsAllowed=replacementsAllowed)
-            for st in nextStLoop:
+                    for stTo in nextStStrict:
+                        nextItems.append((token, i + 1, stTo, objStart, curObjEnd,
+                                          replacementsAllowed, repls))
+            elif not self.det or len(self.get_arc_targets(st, c)) <= 0:
+                # Loop
                 curObjStart = objStart
-                curObjEnd = objEnd
+                curObjEnd = stObjEnd
                 if curObjStart < i < curObjEnd:
                     curObjEnd = i
                 elif curObjStart == i:
@@ -393,13 +507,56 @@ class MorphFST:
                     curObjEnd = i + 1
                 elif curObjEnd == i:
                     curObjEnd -= 1
-                result += self.transduce(token, i + 1, st, curObjStart, curObjEnd,
-                                         replacementsAllowed=replacementsAllowed)
-        elif curState.obj is not None:
-            # The empty tuple at the end stands stores the list of replacements
-            # the token needs to undergo to be accepted by the transducer
-            result += [(objStart, objEnd, obj, ()) for obj in curState.obj]
-        return result
+                nextItems.append((token, i + 1, st, curObjStart, curObjEnd,
+                                  replacementsAllowed, repls))
+
+    def add_replacement_items(self, nextItems, token, i, curState, objStart, objEnd,
+                              replacementsAllowed, repls):
+        """
+        Add the search items that involve a replacement at
+        the character i to nextItems.
+        """
+        lastChar = len(token) - 1
+        replLeft = replacementsAllowed - 1
+        nextStStrictSub, nextStStrictDel = self.get_next_states_with_replacement(curState, token[i])
+
+        # Substitution
+        curObjEnd = objEnd
+        if curObjEnd >= i:
+            curObjEnd = i + 1
+        curRepls = repls + (('sub', i),)
+        for st in nextStStrictSub:
+            nextItems.append((token, i + 1, st, objStart, curObjEnd, replLeft, curRepls))
+        # Deletion (followed a transition without chopping any character)
+        curObjEnd = objEnd
+        if curObjEnd >= i - 1:
+            curObjEnd = i
+        curRepls = repls + (('ins', i),)
+        for st in nextStStrictDel:
+            nextItems.append((token, i, st, objStart, curObjEnd, replLeft, curRepls))
+        # Insertion (did not follow any transition while chopping one character)
+        # Do not apply to the first or the last character of the word
+        if 0 < i < lastChar:
+            curObjEnd = objEnd
+            if curObjEnd >= i:
+                curObjEnd = i + 1
+            nextItems.append((token, i + 1, curState, objStart, curObjEnd, replLeft,
+                              repls + (('del', i),)))
+        # Character swap
+        if i < lastChar and token[i] != token[i+1]:
+            tokenSwap = token[:i] + token[i+1] + token[i] + token[i+2:]
+            curObjEnd = objEnd
+            if curObjEnd >= i:
+                curObjEnd = i + 1
+            curRepls = repls + (('swap', i),)
+            for st in self.get_arc_targets(curState, tokenSwap[i]):
+                nextItems.append((tokenSwap, i + 1, st, objStart, curObjEnd, replLeft, curRepls))
+
+    def freeze(self):
+        """
+        Return a CompactMorphFST with the same states and transitions.
+        """
+        return CompactMorphFST(self)
 
     def __repr__(self):
         result = '****  FST  ****\n'
@@ -408,3 +565,278 @@ class MorphFST:
             result += str(rule[0]) + ' --[' + rule[1] + ']--> ' +\
                 str(self.transitions[rule]) + '\n'
         return result
+
+
+class CompactMorphFST(MorphFST):
+    """
+    Read-only version of a MorphFST that takes much less memory.
+    The states are integers (0 is the start state), and the
+    transitions are stored in flat arrays:
+    - the outgoing arcs of state s are arcs stateStart[s] ... stateStart[s+1]-1,
+      sorted by the code of their character (-1 stands for empty arcs);
+    - the target states of arc a are targets[arcStart[a]] ... targets[arcStart[a+1]-1];
+    - all states directly reachable from state s are
+      byStateTargets[byStateStart[s]] ... byStateTargets[byStateStart[s+1]-1].
+    The results of transduce() are the same as with the original FST.
+    New strings cannot be added to it.
+    """
+
+    def __init__(self, fst):
+        MorphFST.__init__(self, fst.g, verbose=fst.verbose, det=fst.det)
+        if not fst.finalized:
+            fst.finalize()
+        states = fst.get_all_states()
+        stateIdx = {st: i for i, st in enumerate(states)}
+        arcsByState = [[] for _ in range(len(states))]
+        for st, c in fst.transitions:
+            arcsByState[stateIdx[st]].append(c)
+        self.stateStart = array('l', [0])
+        self.arcChars = array('l')
+        self.arcStart = array('l', [0])
+        self.targets = array('l')
+        self.byStateStart = array('l', [0])
+        self.byStateTargets = array('l')
+        self.loopStates = bytearray(len(states))
+        self.objects = [None] * len(states)     # final-state output tables
+        self.closurePlans = [None] * len(states)
+        for i, st in enumerate(states):
+            if st.loopState:
+                self.loopStates[i] = 1
+            if st.closurePlan is not None:
+                self.closurePlans[i] = tuple((step, None if stPlan is None else stateIdx[stPlan], viaEmpty)
+                                             for step, stPlan, viaEmpty in st.closurePlan)
+            if st.obj is not None:
+                self.objects[i] = tuple(st.obj)
+            for c in sorted(arcsByState[i], key=CompactMorphFST.char_code):
+                self.arcChars.append(CompactMorphFST.char_code(c))
+                # The targets are kept in the order in which the
+                # original FST lists them, so that the output is identical
+                self.targets.extend(stateIdx[stTo] for stTo in fst.transitions[(st, c)])
+                self.arcStart.append(len(self.targets))
+            self.stateStart.append(len(self.arcChars))
+            if st in fst.transitionsByState:
+                self.byStateTargets.extend(stateIdx[stTo] for stTo in fst.transitionsByState[st])
+            self.byStateStart.append(len(self.byStateTargets))
+        self.transitions = None
+        self.transitionsByState = None
+        self.startState = 0
+        self.nStates = len(states)
+        self.finalized = True
+
+    @staticmethod
+    def char_code(c):
+        if len(c) <= 0:
+            return -1
+        return ord(c)
+
+    def find_arc(self, curState, code):
+        """
+        Return the number of the arc that goes from curState
+        with the character code, or -1.
+        """
+        lo = self.stateStart[curState]
+        hi = self.stateStart[curState + 1]
+        a = bisect_left(self.arcChars, code, lo, hi)
+        if a < hi and self.arcChars[a] == code:
+            return a
+        return -1
+
+    def arc_targets(self, a):
+        if a < 0:
+            return []
+        return list(self.targets[self.arcStart[a]:self.arcStart[a + 1]])
+
+    def get_objects(self, curState):
+        return self.objects[curState]
+
+    def get_arc_targets(self, curState, curChar):
+        return self.arc_targets(self.find_arc(curState, ord(curChar)))
+
+    def get_closure_plan(self, curState):
+        if self.closurePlans[curState] is not None:
+            return self.closurePlans[curState]
+        if self.loopStates[curState]:
+            return MorphFST.simpleLoopPlan
+        return MorphFST.simplePlan
+
+    def finalize(self):
+        pass
+
+    def get_next_states_strict(self, curState, curChar):
+        return self.arc_targets(self.find_arc(curState, CompactMorphFST.char_code(curChar)))
+
+    def get_next_states(self, curState, curChar):
+        resultStrict = self.arc_targets(self.find_arc(curState, ord(curChar)))
+        resultNonstrict = []
+        resultLoop = []
+        if self.loopStates[curState]:
+            if not self.det or len(resultStrict) <= 0:
+                resultLoop.append(curState)
+        if not self.det:
+            resultNonstrict = self.arc_targets(self.find_arc(curState, -1))
+        return resultStrict, resultNonstrict, resultLoop
+
+    def get_next_states_with_replacement(self, curState, curChar):
+        resultStrictDel = list(self.byStateTargets[self.byStateStart[curState]:
+                                                   self.byStateStart[curState + 1]])
+        if len(resultStrictDel) <= 0:
+            return [], []
+        excluded = set(self.arc_targets(self.find_arc(curState, ord(curChar))))
+        excluded |= set(self.arc_targets(self.find_arc(curState, -1)))
+        resultStrictSub = [st for st in resultStrictDel if st not in excluded]
+        return resultStrictSub, resultStrictDel
+
+    def add_transition(self, curState, curChar, nextState):
+        raise NotImplementedError('A CompactMorphFST cannot be modified.')
+
+    def freeze(self):
+        return self
+
+    def __repr__(self):
+        result = '****  Compact FST  ****\n'
+        for st in range(self.nStates):
+            for a in range(self.stateStart[st], self.stateStart[st + 1]):
+                c = ''
+                if self.arcChars[a] >= 0:
+                    c = chr(self.arcChars[a])
+                result += str(st) + ' --[' + c + ']--> ' + str(self.arc_targets(a)) + '\n'
+        return result
+
+
+class DeterministicMorphFST(MorphFST):
+    """
+    Deterministic version of a MorphFST made by MorphFST.determinize().
+    The states are integers (0 is the start state). Each state has
+    a dictionary of transitions {character -> state} and a default
+    transition (-1 if there is none), which is followed for all
+    other characters.
+    transduce() returns the same objects as the original FST, each
+    of them once. It is meant for paradigm FSTs, where only the objects
+    matter: the positions in the results are not those of the objects.
+    Search with replacements is delegated to the original FST.
+    """
+
+    def __init__(self, fst):
+        MorphFST.__init__(self, fst.g, verbose=fst.verbose)
+        self.nfa = fst
+        self.transitions = None
+        self.transitionsByState = None
+        self.startState = 0
+        self.arcs = []          # state -> {character -> state}
+        self.defaults = []      # state -> state or -1
+        self.objects = []       # state -> tuple of objects or None
+        self.nStates = 0
+        self.finalized = True
+
+    def add_state(self, objects):
+        self.arcs.append({})
+        self.defaults.append(-1)
+        self.objects.append(objects)
+        self.nStates += 1
+        return self.nStates - 1
+
+    def n_states(self):
+        return self.nStates
+
+    def minimize(self):
+        """
+        Return an equivalent DeterministicMorphFST with the minimal
+        number of states (Moore's algorithm).
+        """
+        alphabet = sorted(set(c for stateArcs in self.arcs for c in stateArcs))
+        # Initial partition: by the objects written
+        blockIds = {}
+        blocks = []
+        for st in range(self.nStates):
+            key = ()
+            if self.objects[st] is not None:
+                key = tuple(sorted(id(obj) for obj in self.objects[st]))
+            blocks.append(blockIds.setdefault(key, len(blockIds)))
+        nBlocks = len(blockIds)
+        while True:
+            blockIds = {}
+            newBlocks = []
+            for st in range(self.nStates):
+                default = self.defaults[st]
+                signature = (blocks[st],
+                             -1 if default < 0 else blocks[default],
+                             tuple(-1 if self.arcs[st].get(c, default) < 0
+                                   else blocks[self.arcs[st].get(c, default)]
+                                   for c in alphabet))
+                newBlocks.append(blockIds.setdefault(signature, len(blockIds)))
+            blocks = newBlocks
+            if len(blockIds) == nBlocks:
+                break
+            nBlocks = len(blockIds)
+        # Number the new states in the order of their first appearance,
+        # so that the start state is still 0
+        newIdx = {}
+        representatives = []
+        for st in range(self.nStates):
+            if blocks[st] not in newIdx:
+                newIdx[blocks[st]] = len(representatives)
+                representatives.append(st)
+        minFst = DeterministicMorphFST(self.nfa)
+        for st in representatives:
+            newState = minFst.add_state(self.objects[st])
+            default = -1
+            if self.defaults[st] >= 0:
+                default = newIdx[blocks[self.defaults[st]]]
+            minFst.defaults[newState] = default
+            for c in self.arcs[st]:
+                target = newIdx[blocks[self.arcs[st][c]]]
+                if target != default:
+                    minFst.arcs[newState][c] = target
+        return minFst
+
+    def get_objects(self, curState):
+        return self.objects[curState]
+
+    def get_next_states_strict(self, curState, curChar):
+        if curChar in self.arcs[curState]:
+            return [self.arcs[curState][curChar]]
+        return []
+
+    def get_next_states(self, curState, curChar):
+        nextState = self.arcs[curState].get(curChar, self.defaults[curState])
+        if nextState < 0:
+            return [], [], []
+        return [nextState], [], []
+
+    def finalize(self):
+        pass
+
+    def add_transition(self, curState, curChar, nextState):
+        raise NotImplementedError('A DeterministicMorphFST cannot be modified.')
+
+    def transduce(self, token, startChar=0, startState=None,
+                  objStart=0, objEnd=-1,
+                  replacementsAllowed=0):
+        if replacementsAllowed > 0 or startState is not None:
+            return self.nfa.transduce(token, startChar=startChar, startState=startState,
+                                      objStart=objStart, objEnd=objEnd,
+                                      replacementsAllowed=replacementsAllowed)
+        if objEnd == -1 or objEnd > len(token) - 1:
+            objEnd = len(token) - 1
+        curState = 0
+        arcs = self.arcs
+        defaults = self.defaults
+        for i in range(startChar, len(token)):
+            curState = arcs[curState].get(token[i], defaults[curState])
+            if curState < 0:
+                return []
+        if self.objects[curState] is None:
+            return []
+        return [(objStart, objEnd, obj, ()) for obj in self.objects[curState]]
+
+    def freeze(self):
+        return self
+
+    def __repr__(self):
+        result = '****  Deterministic FST  ****\n'
+        for st in range(self.nStates):
+            for c in sorted(self.arcs[st]):
+                result += str(st) + ' --[' + c + ']--> ' + str(self.arcs[st][c]) + '\n'
+            if self.defaults[st] >= 0:
+                result += str(st) + ' --[*]--> ' + str(self.defaults[st]) + '\n'
+        return result
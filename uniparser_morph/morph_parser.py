@@ -1,15 +1,61 @@
 import re
+import sys
 import copy
+import sqlite3
 import time
-import textdistance
-from .common_functions import GLOSS_EMPTY, GLOSS_STEM, GLOSS_STEM_FORCED, GLOSS_STARTWITHSELF, POS_NONFINAL
+import heapq
+import tempfile
+import collections
+import multiprocessing
+from .common_functions import GLOSS_EMPTY, GLOSS_STEM, GLOSS_STEM_FORCED, GLOSS_STARTWITHSELF, POS_NONFINAL,\
+    bounded_edit_distance
 from .paradigm import Paradigm, Inflexion
 from .wordform import Wordform
 from .clitic import SIDE_ENCLITIC, SIDE_PROCLITIC, SIDE_OTHER
-from .morph_fst import MorphFST
+from .morph_fst import MorphFST, DeterministicMorphFST
+from .analysis_cache import AnalysisCache
+from .disk_cache import DiskAnalysisCache
+from .fuzzy_lookup import FuzzyStemLookup
+from .stem_index import DeletionStemIndex, StemTrie
+from .suffix_lookup import SuffixFirstLookup
+from .bad_analyses import BadAnalysisIndex
+from .lex_rule import LexRule
+
+
+_forkedParser = None    # the Parser instance the worker processes inherit when forked
+
+
+def _parse_chunk_forked(args):
+    """
+    Analyze a chunk of tokens in a worker process.
+    """
+    tokens, glossing, replacementsAllowed = args
+    return _forkedParser.parse_chunk(tokens, glossing=glossing,
+                                     replacementsAllowed=replacementsAllowed)
+
+
+class InflLevel:
+    """
+    One level of the inflexion stack of a ParseState: the inflexion,
+    the paradigm link it was reached by, and the position in it.
+    Levels are shared between a state and the states made from it,
+    so a state has to call ParseState.writable_level() before
+    changing one of them.
+    """
+    __slots__ = ('curInfl', 'paraLink', 'curPart', 'curPos')
+
+    def __init__(self, curInfl, paraLink=None, curPart=0, curPos=0):
+        self.curInfl = curInfl
+        self.paraLink = paraLink
+        self.curPart = curPart
+        self.curPos = curPos
 
 
 class ParseState:
+    __slots__ = ('wf', 'sl', 'wfCorrStart', 'stemCorrStart', 'corrLength',
+                 'curStemPos', 'curPos', 'inflLevels', 'ownLevels', 'curLevel',
+                 'derivsUsed')
+
     def __init__(self, wf, sl, wfCorrStart, stemCorrStart, corrLength,
                  inflLevels=None, curLevel=-1, curStemPos=0, curPos=0,
                  derivsUsed=None, nextInfl=None, paraLink=None):
@@ -20,18 +66,44 @@ class ParseState:
         self.corrLength = corrLength
         self.curStemPos = curStemPos
         self.curPos = curPos
+        # The tuple of InflLevel objects is shared with the state this one
+        # was made from; ownLevels is the bit mask of the levels that
+        # belong to this state only and can be changed in place.
         if inflLevels is None:
-            self.inflLevels = []
+            self.inflLevels = ()
         else:
-            self.inflLevels = [copy.copy(il) for il in inflLevels]
+            self.inflLevels = tuple(inflLevels)
+        self.ownLevels = 0
         self.curLevel = curLevel
         if nextInfl is not None:
-            self.inflLevels.append({'curInfl': nextInfl, 'paraLink': paraLink,
-                                    'curPart': 0, 'curPos': 0})
+            self.ownLevels = 1 << len(self.inflLevels)
+            self.inflLevels += (InflLevel(nextInfl, paraLink),)
         if derivsUsed is None:
-            self.derivsUsed = []
+            self.derivsUsed = ()
         else:
-            self.derivsUsed = copy.copy(derivsUsed)
+            self.derivsUsed = tuple(derivsUsed)
+
+    def writable_level(self, iLevel):
+        """
+        Return the InflLevel object with the given index, copying
+        it first if it is shared with other states.
+        """
+        if not self.ownLevels & (1 << iLevel):
+            level = self.inflLevels[iLevel]
+            level = InflLevel(level.curInfl, level.paraLink, level.curPart, level.curPos)
+            self.inflLevels = self.inflLevels[:iLevel] + (level,) + self.inflLevels[iLevel + 1:]
+            self.ownLevels |= 1 << iLevel
+        return self.inflLevels[iLevel]
+
+    def key(self):
+        """
+        Return a hashable value that is the same for the states
+        which are bound to lead to the same analyses.
+        """
+        return (self.wf, id(self.sl), self.wfCorrStart, self.stemCorrStart, self.corrLength,
+                self.curStemPos, self.curPos, self.curLevel, self.derivsUsed,
+                tuple((id(level.curInfl), id(level.paraLink), level.curPart, level.curPos)
+                      for level in self.inflLevels))
 
     def __repr__(self):
         if self.curLevel == -1:
@@ -51,14 +123,14 @@ class ParseState:
             else:
                 offset = '  '
             res += offset
-            for fp in inflLevel['curInfl'].flexParts[0]:
+            for fp in inflLevel.curInfl.flexParts[0]:
                 res += fp.flex + ' '
             res += '\n' + offset
-            for i in range(len(inflLevel['curInfl'].flexParts[0])):
-                if i >= inflLevel['curPart']:
+            for i in range(len(inflLevel.curInfl.flexParts[0])):
+                if i >= inflLevel.curPart:
                     break
-                res += ' ' * len(inflLevel['curInfl'].flexParts[0][i].flex) + ' '
-            res += ' ' * inflLevel['curPos'] + '^'
+                res += ' ' * len(inflLevel.curInfl.flexParts[0][i].flex) + ' '
+            res += ' ' * inflLevel.curPos + '^'
             res += '\n'
         return res
 
@@ -66,11 +138,20 @@ class ParseState:
 class Parser:
     MAX_STEM_START_LEN = 6
     MAX_EMPTY_INFLEXIONS = 2
-    MAX_TOKEN_LENGTH = 512          # to avoid stack overflow in FST recursion
+    MAX_TOKEN_LENGTH = 512          # longer tokens are not analyzed (they are hardly ever words)
     MIN_REPLACEMENT_STEM_LEN = 5    # minimal length of a stem found with at least one replacement
     MIN_REPLACEMENT_WORD_LEN = 6    # minimal length of a word form that can be only accepted with replacements
     REMEMBER_PARSES = False         # useless if parsing a frequency list
+    PARSE_CACHE_SIZE = 100000       # max number of tokens whose analyses are remembered
+    PARSE_CACHE_BYTES = 0           # approximate max size of remembered analyses (0 = no limit)
+    PARSE_CACHE_POLICY = 'lru'      # 'lru' or 'freq' (see AnalysisCache)
     WILDCARD = '•'                  # technical character that is considered equal to any single character
+    WORKER_CHUNK_SIZE = 500         # how many tokens a worker process gets at a time
+    MAX_SORT_LINES_IN_MEMORY = 2000000  # larger frequency lists are sorted with temporary files
+    DETERMINIZE_PARADIGMS = False   # use deterministic minimized FSTs for paradigm affixes
+    MAX_DETERMINIZED_STATES = 50000 # keep the non-deterministic FST if the deterministic one is larger
+    COMPACT_FSTS = False            # turn the FSTs into read-only CompactMorphFSTs after filling them
+    TEXT_BLOCK_SIZE = 1 << 20       # how many characters parse_txt() reads at a time
 
     rxFirstNonEmptyPart = re.compile('^(.*?)([^ .()\\[\\]<>|~]{1,' + str(MAX_STEM_START_LEN) +
                                      '})')
@@ -80,6 +161,17 @@ class Parser:
                                '([0-9,.\\-%]+|'
                                '[\\w\\-\'`´‘’‛/@.,]+?)'
                                '([^\\w]*)$')
+    MAX_FUZZY_STEPS = 200000        # max search steps when looking for a stem with replacements
+    FUZZY_STEM_INDEX = False        # use a DeletionStemIndex when looking for stems with replacements
+    MAX_INDEX_DISTANCE = 2          # max number of replacements the DeletionStemIndex is built for
+    FST_STEM_PREFILTER = False      # skip the stem FST if no stem starts occur in the word
+    REMEMBER_HOSTS = True           # remember the analyses of the hosts (words without clitics)
+    HOST_CACHE_SIZE = 20000         # max number of hosts whose analyses are remembered
+    HOST_CACHE_BYTES = 50000000     # approximate max size of remembered host analyses (0 = no limit)
+    INFLEXION_CACHE_SIZE = 200000   # max number of remembered paradigm affix lookups
+    MAX_PARSE_STATES = 0            # max number of parse states investigated for one token (0 = no limit)
+    MAX_PARSE_TIME = 0              # max number of seconds spent on investigating states for one token (0 = no limit)
+    STEP_INVESTIGATE, STEP_DERIVATIONS_DONE, STEP_STATE_DONE = range(3)     # explore_states() stack items
     rxNoReplacements = None         # words that should not be searched with replacements (language-specific)
 
     def __init__(self, g, verbose=0, parsingMethod='fst', errorHandler=None):
@@ -88,24 +180,134 @@ class Parser:
             errorHandler = self.g.errorHandler
         self.errorHandler = errorHandler
         self.verbose = verbose
-        self.parsingMethod = parsingMethod  # 'hash' or 'fst'
+        self.parsingMethod = parsingMethod  # 'hash', 'fst' or 'suffix'
         Wordform.verbosity = self.verbose
         self.wfs = {}    # list of wordforms stored in memory
                          # wordform -> [possible Wordform objects]
         self.stemStarters = {}   # letter -> [subLexemes whose firt non-empty
                                  # part starts with that letter]
                                  # (used with 'hash' parsing method)
+        self.stemTrie = StemTrie()  # the same stem starters in an Aho-Corasick automaton
+                                    # (also used with 'fst' parsing method if FST_STEM_PREFILTER is on)
+        self.stemPrefilterFilled = False    # whether fill_stem_fst() added the stem starts to stemTrie
         self.stemFst = MorphFST(self.g, self.verbose)  # (used with 'fst' parsing method)
         self.incorpFst = MorphFST(self.g, self.verbose)
         self.paradigmFsts = {}   # paradigm_name -> FST for its affixes
                                  # (used with 'fst' parsing method)
-        self.dictParses = {}        # token -> [possible Wordform objects]
+        self.paradigmFilters = {}   # paradigm_name -> checks for its inflexions
+                                    # (used with 'hash' parsing method, see make_paradigm_filter())
+        self.fuzzyLookup = None  # FuzzyStemLookup for searching stems with replacements
+        self.stemIndex = None    # DeletionStemIndex for the same purpose, if any
+        self.suffixLookup = None # SuffixFirstLookup (used with 'suffix' parsing method)
+        self.procliticTrie = StemTrie()     # proclitic stems -> [(number in g.clitics, Clitic)]
+        self.encliticTrie = StemTrie()      # reversed enclitic stems -> the same
+        self.nCliticsIndexed = 0            # how many clitics of the grammar are in the tries
+        self.badAnalysisIndex = None        # BadAnalysisIndex made from the templates in the grammar
+        self.parseCache = None      # (token, replacementsAllowed) -> (possible Wordform objects)
+        self.set_parse_cache()
+        self.inflexionCache = AnalysisCache(maxEntries=self.INFLEXION_CACHE_SIZE)
+                                    # (paradigm name, rest of the word, findDerivations, emptyDepth)
+                                    # -> inflexion candidates (see find_inflexions_fst())
+        self.hostCache = AnalysisCache(maxEntries=self.HOST_CACHE_SIZE, maxBytes=self.HOST_CACHE_BYTES,
+                                       sizeFunc=Parser.approx_analyses_size)
+                                    # (host, replacementsAllowed, replacement settings)
+                                    # -> (analyses returned by parse_host())
+        self.diskCache = None       # DiskAnalysisCache shared between runs, if any
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['diskCache'] = None   # belongs to the run, not to the grammar
+        return state
 
     def raise_error(self, message, data=None):
         if self.errorHandler is None:
             self.errorHandler = self.g.errorHandler
         self.errorHandler.raise_error(message, data)
 
+    def set_parse_cache(self, maxEntries=None, maxBytes=None, policy=None):
+        """
+        Create an empty cache for the analyses returned by parse().
+        The arguments that are not set are taken from the class
+        constants. The cache is only used if REMEMBER_PARSES is True.
+        """
+        if maxEntries is None:
+            maxEntries = self.PARSE_CACHE_SIZE
+        if maxBytes is None:
+            maxBytes = self.PARSE_CACHE_BYTES
+        if policy is None:
+            policy = self.PARSE_CACHE_POLICY
+        try:
+            self.parseCache = AnalysisCache(maxEntries=maxEntries, maxBytes=maxBytes,
+                                            policy=policy, sizeFunc=Parser.approx_analyses_size)
+        except ValueError:
+            self.raise_error('Wrong parse cache policy: ' + str(policy))
+            self.parseCache = AnalysisCache(maxEntries=maxEntries, maxBytes=maxBytes,
+                                            sizeFunc=Parser.approx_analyses_size)
+
+    def set_disk_cache(self, fname, fingerprint):
+        """
+        Use the SQLite file fname as a persistent cache for the
+        analyses returned by parse(). fingerprint identifies the
+        current version of the grammar: the analyses stored with
+        other fingerprints are not used. If fname is None, stop
+        using the persistent cache.
+        """
+        if self.diskCache is not None:
+            self.diskCache.close()
+            self.diskCache = None
+        if fname is None or len(fname) <= 0:
+            return
+        self.diskCache = DiskAnalysisCache(fname, fingerprint)
+        try:
+            self.diskCache.connect()
+        except sqlite3.Error as e:
+            self.raise_error('Could not open the analysis cache ' + fname + ': ' + str(e))
+            self.diskCache = None
+
+    def replacement_settings(self, replacementsAllowed):
+        """
+        Return a tuple with the settings that the analyses with
+        replacements depend on, but which are not part of the
+        grammar fingerprint, or None if no replacements are allowed.
+        """
+        if replacementsAllowed <= 0:
+            return None
+        if self.rxNoReplacements is None:
+            return self.MIN_REPLACEMENT_WORD_LEN, self.MIN_REPLACEMENT_STEM_LEN, None, 0
+        return (self.MIN_REPLACEMENT_WORD_LEN, self.MIN_REPLACEMENT_STEM_LEN,
+                self.rxNoReplacements.pattern, self.rxNoReplacements.flags)
+
+    @staticmethod
+    def approx_analyses_size(analyses):
+        """
+        Return approximate number of bytes taken by a list of Wordform
+        objects (only strings are taken into account).
+        """
+        size = sys.getsizeof(analyses)
+        for ana in analyses:
+            size += sys.getsizeof(ana)
+            for field in ('wf', 'wfGlossed', 'wfGlossedStd', 'gloss', 'lemma', 'gramm', 'stem'):
+                value = getattr(ana, field, None)
+                if value is not None:
+                    size += sys.getsizeof(value)
+            for k, v in ana.otherData:
+                size += sys.getsizeof(k) + sys.getsizeof(v)
+        return size
+
+    @staticmethod
+    def copy_analyses(analyses):
+        """
+        Return a list with copies of the Wordform objects, so that
+        the caller can change them without spoiling the cached ones.
+        """
+        anaCopies = []
+        for ana in analyses:
+            anaCopy = copy.copy(ana)
+            anaCopy.otherData = list(ana.otherData)
+            anaCopy.subwords = list(ana.subwords)
+            anaCopies.append(anaCopy)
+        return anaCopies
+
     def print_stem_starters(self):
         if self.verbose > 0:
             print('Filling stem starters dictionary complete.')
@@ -150,12 +352,15 @@ class Parser:
                     self.stemStarters[start] += sl
                 except KeyError:
                     self.stemStarters[start] = sl
+        for start, sl in self.stemStarters.items():
+            self.stemTrie.add(start, sl)
         self.print_stem_starters()
 
     def fill_stem_fst(self):
         """
         Prepare FST with the stems ('fst' parsing method)
         """
+        bPrefilter = self.FST_STEM_PREFILTER
         for l in self.g.lexemes:
             for sl in l.subLexemes:
                 m = self.rxFirstNonEmptyPart.search(sl.stem)
@@ -165,6 +370,15 @@ class Parser:
                     self.add_all_wordforms(l)
                     break
                 self.stemFst.add_stem(sl)
+                if self.suffixLookup is not None:
+                    self.suffixLookup.add_stem(sl)
+                if bPrefilter:
+                    # The first part of the stem that must literally occur in the word
+                    stemStart = self.stemFst.prepare_stem(sl.stem).strip('.').split('.')[0]
+                    self.stemTrie.add(stemStart[:self.MAX_STEM_START_LEN], [sl])
+                if self.stemIndex is not None:
+                    self.stemIndex.add_stem(sl)
+        self.stemPrefilterFilled = bPrefilter
 
     def fill_incorporated_stem_fst(self):
         """
@@ -185,14 +399,29 @@ class Parser:
         This is a necessary preliminary step before the analysis
         begins. Usually it takes up to 10 seconds to complete.
         """
-        if self.parsingMethod == 'fst':
+        self.hostCache.clear()
+        if self.parsingMethod in ('fst', 'suffix'):
+            if self.FUZZY_STEM_INDEX:
+                self.stemIndex = DeletionStemIndex(self.g, maxDistance=self.MAX_INDEX_DISTANCE,
+                                                   minStemLen=self.MIN_REPLACEMENT_STEM_LEN,
+                                                   verbose=self.verbose)
+            if self.parsingMethod == 'suffix':
+                # The stem FST is still used for the search with replacements
+                self.suffixLookup = SuffixFirstLookup(self.g, verbose=self.verbose)
+                self.suffixLookup.fill_endings()
             self.fill_stem_fst()
+            if self.stemIndex is not None and self.verbose > 0:
+                print('Stem index filled:', len(self.stemIndex), 'stems,',
+                      len(self.stemIndex.variants), 'deletion variants.')
         elif self.parsingMethod == 'hash':
             self.fill_stem_dicts()
+            self.fill_paradigm_filters()
         else:
             self.raise_error('Unable to fill stems because the parsing method ' +
                              self.parsingMethod + ' is not supported.')
         self.fill_incorporated_stem_fst()
+        if self.COMPACT_FSTS:
+            self.compact_fsts()
 
     def make_paradigm_fst(self, para):
         """
@@ -201,14 +430,25 @@ class Parser:
         fst = MorphFST(self.g, verbose=self.verbose)
         for infl in para.flex:
             fst.add_affix(infl)
-        # fst = fst.determinize()
+        if self.DETERMINIZE_PARADIGMS:
+            detFst = fst.determinize(maxStates=self.MAX_DETERMINIZED_STATES)
+            if detFst is not None:
+                if self.verbose > 1:
+                    print('Paradigm', para.name, 'determinized:', fst.n_states(),
+                          '->', detFst.n_states(), 'states.')
+                return detFst
+            if self.verbose > 0:
+                print('Paradigm', para.name, 'could not be determinized, its FST has',
+                      fst.n_states(), 'states.')
         return fst
 
     def fill_affixes(self):
         """
         Add affixes from all paradigms to the FSTs. This step is
-        necessary only when parsing method is set to 'fst'.
+        necessary only when parsing method is set to 'fst' or 'suffix'.
         """
+        self.inflexionCache.clear()
+        self.hostCache.clear()
         for p in self.g.paradigms:
             if self.verbose > 1:
                 print('Making an FST for', p, '...')
@@ -216,6 +456,30 @@ class Parser:
             self.paradigmFsts[p] = self.make_paradigm_fst(para)
         if self.verbose > 0:
             print('Created FSTs for', len(self.paradigmFsts), 'paradigms.')
+            if self.DETERMINIZE_PARADIGMS:
+                nDet = sum(1 for fst in self.paradigmFsts.values()
+                           if isinstance(fst, DeterministicMorphFST))
+                print(nDet, 'of them determinized,',
+                      sum(fst.n_states() for fst in self.paradigmFsts.values()),
+                      'states in total.')
+        if self.COMPACT_FSTS:
+            self.compact_fsts()
+
+    def compact_fsts(self):
+        """
+        Replace all FSTs with their read-only compact versions,
+        which take less memory and produce the same results.
+        """
+        self.stemFst = self.stemFst.freeze()
+        self.incorpFst = self.incorpFst.freeze()
+        if self.stemIndex is not None:
+            self.stemIndex.freeze()
+        if self.suffixLookup is not None:
+            self.suffixLookup.freeze()
+        for p in self.paradigmFsts:
+            self.paradigmFsts[p] = self.paradigmFsts[p].freeze()
+        if self.verbose > 0:
+            print('FSTs compacted, the stem FST has', self.stemFst.nStates, 'states.')
 
     def analysis_conforms(self, wf, template):
         """
@@ -226,11 +490,11 @@ class Parser:
         # for badAna in self.g.badAnalyses:
         for k, v in template.items():
             try:
-                realValue = wf.__dict__[k]
+                realValue = getattr(wf, k)
                 if v.search(realValue) is None:
                     return False
                 # print(v.pattern, k)
-            except KeyError:
+            except AttributeError:
                 return False
         return True
 
@@ -284,7 +548,7 @@ class Parser:
         """
         emptyDepth = 0
         for level in range(len(state.inflLevels)):
-            infl = state.inflLevels[level]['curInfl']
+            infl = state.inflLevels[level].curInfl
             if (len(infl.flexParts) <= 0 or len(infl.flexParts[0]) <= 0 or
                     (len(infl.flexParts[0]) == 1 and len(infl.flexParts[0][0].flex) <= 0)) and\
                      len(infl.subsequent) > 0:
@@ -297,52 +561,185 @@ class Parser:
         """
         inflCount = 0
         for level in range(len(state.inflLevels)):
-            curInfl = state.inflLevels[level]['curInfl']
+            curInfl = state.inflLevels[level].curInfl
             if curInfl == infl:
                 inflCount += 1
         return inflCount
 
     def find_inflexions_fst(self, state, paraName, findDerivations=False, emptyDepth=0):
-        try:
-            paraFst = self.paradigmFsts[paraName]
-        except KeyError:
+        if paraName not in self.paradigmFsts:
             self.raise_error('No FST for the paradigm ' + paraName)
             para = self.g.paradigms[paraName]
             return self.find_inflexions_simple(state, para,
                                                findDerivations, emptyDepth)
         # print(state.wf, state.curPos)
-        # print(paraFst)
-        startChar = objStart = state.curPos
+        startChar = state.curPos
         if state.curPos == state.wfCorrStart:
-            startChar = objStart = state.wfCorrStart + state.corrLength
-        suitableInfl = paraFst.transduce(state.wf, startChar=startChar,
-                                         objStart=objStart)
+            startChar = state.wfCorrStart + state.corrLength
+        # Many words share the same ending, so the inflexions found
+        # in it are remembered across tokens
+        cacheKey = (paraName, state.wf[startChar:], findDerivations, emptyDepth)
+        candidates = self.inflexionCache.get(cacheKey)
+        if candidates is None:
+            candidates = self.inflexion_candidates(cacheKey[1], paraName,
+                                                   findDerivations, emptyDepth)
+            self.inflexionCache.put(cacheKey, candidates)
+        result = []
+        for infl, inflParaName, emptyInfls, bDerivParadigms in candidates:
+            if bDerivParadigms and len(state.derivsUsed) >= self.g.MAX_DERIVATIONS:
+                continue
+            if self.infl_count(state, infl) >= self.g.RECURS_LIMIT:
+                continue
+            if any(self.infl_count(state, emptyInfl) >= self.g.RECURS_LIMIT
+                   for emptyInfl in emptyInfls):
+                continue
+            result.append((infl, inflParaName))
+        # print('found:', [str(f[0]) for f in result])
+        return result
+
+    def inflexion_candidates(self, wfEnd, paraName, findDerivations=False, emptyDepth=0):
+        """
+        Find the inflexions of the paradigm that the remaining part
+        of the word, wfEnd, may start with, replacing the empty
+        inflexions with the inflexions of the paradigms they lead to.
+        Return a list of tuples (inflexion, paradigm name, empty
+        inflexions it was reached through, whether any of the paradigms
+        on the way was derivational). The result does not depend on
+        the parse state, so find_inflexions_fst() can cache it and
+        filter it for each state.
+        """
         result = []
-        # print('Looking for:', state.wf, state.curPos, startChar)
+        # print('Looking for:', wfEnd)
         # print('paradigm:', paraName, '\n***\n',
         #       u'\n----\n'.join(f.flex for f in grammar.Grammar.paradigms[paraName].flex))
-        # print(paraFst)
-        for inflStart, inflEnd, infl, repl in suitableInfl:
+        for inflStart, inflEnd, infl, repl in self.paradigmFsts[paraName].transduce(wfEnd):
             # print(inflStart, inflEnd, infl)
             if findDerivations and len(infl.flexParts) > 0 and\
                             len(infl.flexParts[0]) > 0 and\
                             infl.flexParts[0][0].glossType != GLOSS_STARTWITHSELF:
                 continue
-            elif self.infl_count(state, infl) >= self.g.RECURS_LIMIT:
-                continue
             elif (len(infl.flexParts) <= 0 or len(infl.flexParts[0]) <= 0 or
                   (len(infl.flexParts[0]) == 1 and len(infl.flexParts[0][0].flex) <= 0)) and\
                   len(infl.subsequent) > 0:
+                if emptyDepth + 1 > self.MAX_EMPTY_INFLEXIONS:
+                    continue
+                for sp in infl.subsequent:
+                    if sp.name not in self.g.paradigms:
+                        self.raise_error('Wrong paradigm name: ' + sp.name)
+                        continue
+                    if sp.name not in self.paradigmFsts:
+                        self.raise_error('No FST for the paradigm ' + sp.name)
+                        continue
+                    for subInfl, subParaName, emptyInfls, bDerivParadigms in\
+                            self.inflexion_candidates(wfEnd, sp.name, findDerivations, emptyDepth + 1):
+                        result.append((subInfl, subParaName, (infl,) + emptyInfls,
+                                       bDerivParadigms or '#deriv' in sp.name))
+            else:
+                result.append((infl, paraName, (), False))
+        return result
+
+    @staticmethod
+    def inflexion_check(infl):
+        """
+        Return a tuple (check, string) that describes what
+        inflexion_is_good() looks for in the rest of the word, apart
+        from the derivation and recursion limits:
+        - ('never', '') if the inflexion cannot be used at all;
+        - ('prefix', s) if the rest of the word has to start with s;
+        - ('contains', s) if it has to contain s;
+        - (None, '') if there is nothing to check.
+        """
+        if len(infl.flexParts) <= 0 or len(infl.flexParts[0]) <= 0:
+            return 'never', ''
+        for fp in infl.flexParts[0]:
+            if fp.glossType == GLOSS_EMPTY or len(fp.flex) <= 0:
+                continue
+            if fp.flex == '<.>' or fp.glossType in [GLOSS_STEM, GLOSS_STEM_FORCED]:
+                # See inflexion_may_conform()
+                for fpNext in infl.flexParts[0]:
+                    if fpNext.glossType in [GLOSS_EMPTY, GLOSS_STEM,
+                                            GLOSS_STEM_FORCED, GLOSS_STARTWITHSELF]\
+                            or fpNext.flex == '<.>':
+                        continue
+                    if len(fpNext.flex) <= 0:
+                        return None, ''
+                    return 'contains', fpNext.flex
+                return None, ''
+            return 'prefix', fp.flex
+        return None, ''
+
+    def make_paradigm_filter(self, para):
+        """
+        Precompute the checks inflexion_is_good() makes for each
+        inflexion of the paradigm. Return a tuple (checks, inflexions
+        by first character, other inflexions), where checks is the list
+        of tuples (check, string, starts with GLOSS_STARTWITHSELF, is
+        empty and leads to other paradigms) for each inflexion, the
+        second element is a dictionary character -> [numbers of the
+        inflexions that require the rest of the word to start with it],
+        and the third one is the list of numbers of the inflexions that
+        have to be looked at whatever the next character is.
+        """
+        checks = []
+        inflByFirstChar = {}
+        otherInfl = []
+        for iInfl in range(len(para.flex)):
+            infl = para.flex[iInfl]
+            check, checkStr = Parser.inflexion_check(infl)
+            bStartsWithSelf = (check != 'never'
+                               and infl.flexParts[0][0].glossType == GLOSS_STARTWITHSELF)
+            bEmpty = ((len(infl.flexParts) <= 0 or len(infl.flexParts[0]) <= 0 or
+                       (len(infl.flexParts[0]) == 1 and len(infl.flexParts[0][0].flex) <= 0))
+                      and len(infl.subsequent) > 0)
+            checks.append((check, checkStr, bStartsWithSelf, bEmpty))
+            if check == 'prefix' and not bEmpty:
+                try:
+                    inflByFirstChar[checkStr[0]].append(iInfl)
+                except KeyError:
+                    inflByFirstChar[checkStr[0]] = [iInfl]
+            elif check != 'never' or bEmpty:
+                otherInfl.append(iInfl)
+        return checks, inflByFirstChar, otherInfl
+
+    def fill_paradigm_filters(self):
+        """
+        Precompute the checks for the inflexions of all paradigms
+        (used with 'hash' parsing method).
+        """
+        self.paradigmFilters = {}
+        for paraName, para in self.g.paradigms.items():
+            self.paradigmFilters[paraName] = self.make_paradigm_filter(para)
+
+    def find_inflexions_simple(self, state, para, findDerivations=False, emptyDepth=0):
+        if state.curPos < 0:
+            return self.find_inflexions_unfiltered(state, para, findDerivations, emptyDepth)
+        try:
+            checks, inflByFirstChar, otherInfl = self.paradigmFilters[para.name]
+        except KeyError:
+            self.paradigmFilters[para.name] = self.make_paradigm_filter(para)
+            checks, inflByFirstChar, otherInfl = self.paradigmFilters[para.name]
+        # Only the inflexions that can start with the next character are checked
+        inflToCheck = otherInfl
+        if state.curPos < len(state.wf) and state.wf[state.curPos] in inflByFirstChar:
+            inflToCheck = sorted(otherInfl + inflByFirstChar[state.wf[state.curPos]])
+        result = []
+        for iInfl in inflToCheck:
+            infl = para.flex[iInfl]
+            check, checkStr, bStartsWithSelf, bEmpty = checks[iInfl]
+            if (check != 'never'
+                    and (not findDerivations or bStartsWithSelf)
+                    and (check != 'prefix' or state.wf.startswith(checkStr, state.curPos))
+                    and (check != 'contains' or state.wf.find(checkStr, state.curPos) >= 0)
+                    and self.infl_count(state, infl) < self.g.RECURS_LIMIT):
+                result.append((infl, para.name))
+            if bEmpty:
                 for sp in infl.subsequent:
                     result += self.find_inflexions(state, sp.name,
                                                    emptyDepth=emptyDepth + 1,
                                                    findDerivations=findDerivations)
-            else:
-                result.append((infl, paraName))
-        # print('found:', [str(f[0]) for f in result])
         return result
 
-    def find_inflexions_simple(self, state, para, findDerivations=False, emptyDepth=0):
+    def find_inflexions_unfiltered(self, state, para, findDerivations=False, emptyDepth=0):
         result = []
         for infl in para.flex:
             if self.inflexion_is_good(state, infl, findDerivations=findDerivations):
@@ -371,7 +768,7 @@ class Parser:
             return []
         if self.parsingMethod == 'hash':
             return self.find_inflexions_simple(state, para, findDerivations, emptyDepth)
-        elif self.parsingMethod == 'fst':
+        elif self.parsingMethod in ('fst', 'suffix'):
             return self.find_inflexions_fst(state, paraName, findDerivations, emptyDepth)
         return []
 
@@ -391,30 +788,30 @@ class Parser:
                 if state.sl.stem[i] != '.':
                     return None
         # check if the lowest level contains an inflexion that requires continuation
-        lastInfl = state.inflLevels[-1]['curInfl']
+        lastInfl = state.inflLevels[-1].curInfl
         if (lastInfl.position != POS_NONFINAL and
                 any(fp.flex == '<.>' for fp in lastInfl.flexParts[0])):
             return None
         # check if inflexions at all levels have been finished
         for inflLevel in state.inflLevels:
-            if inflLevel['curPart'] < len(inflLevel['curInfl'].flexParts[0]):
-                for iPos in range(inflLevel['curPos'] + 1,
-                                  len(inflLevel['curInfl'].flexParts[0][inflLevel['curPart']].flex)):
-                    if inflLevel['curInfl'].flexParts[0][inflLevel['curPart']].flex[iPos] not in '.<>[]~|':
+            if inflLevel.curPart < len(inflLevel.curInfl.flexParts[0]):
+                for iPos in range(inflLevel.curPos + 1,
+                                  len(inflLevel.curInfl.flexParts[0][inflLevel.curPart].flex)):
+                    if inflLevel.curInfl.flexParts[0][inflLevel.curPart].flex[iPos] not in '.<>[]~|':
                         # print('NONE')
                         return None
-                for iPart in range(inflLevel['curPart'] + 1, len(inflLevel['curInfl'].flexParts[0])):
-                    if inflLevel['curInfl'].flexParts[0][inflLevel['curPart']].glossType not in\
+                for iPart in range(inflLevel.curPart + 1, len(inflLevel.curInfl.flexParts[0])):
+                    if inflLevel.curInfl.flexParts[0][inflLevel.curPart].glossType not in\
                         [GLOSS_STEM, GLOSS_STEM_FORCED,
                          GLOSS_STARTWITHSELF] and\
-                            len(inflLevel['curInfl'].flexParts[0][inflLevel['curPart']].flex) > 0:
-                        # print(inflLevel['curInfl'].flexParts[0][inflLevel['curPart']].flex)
+                            len(inflLevel.curInfl.flexParts[0][inflLevel.curPart].flex) > 0:
+                        # print(inflLevel.curInfl.flexParts[0][inflLevel.curPart].flex)
                         return None
-        infl = copy.deepcopy(state.inflLevels[0]['curInfl'])
+        infl = copy.deepcopy(state.inflLevels[0].curInfl)
         for iLevel in range(1, len(state.inflLevels)):
             curLevel = state.inflLevels[iLevel]
-            Paradigm.join_inflexions(infl, copy.deepcopy(curLevel['curInfl']),
-                                     curLevel['paraLink'],
+            Paradigm.join_inflexions(infl, copy.deepcopy(curLevel.curInfl),
+                                     curLevel.paraLink,
                                      partialCompile=self.g.PARTIAL_COMPILE)
 
         if infl is None:
@@ -428,7 +825,7 @@ class Parser:
                     or wf.wf is None or state.wf is None
                     or len(wf.wf) < self.MIN_REPLACEMENT_WORD_LEN or len(state.wf) < self.MIN_REPLACEMENT_WORD_LEN):
                 return None
-            elif textdistance.damerau_levenshtein.distance(wf.wf, state.wf) > replacementsAllowed:
+            elif bounded_edit_distance(wf.wf, state.wf, replacementsAllowed) > replacementsAllowed:
                 return None
         if self.verbose > 0:
             print(state)
@@ -446,9 +843,9 @@ class Parser:
             return True
         if len(state.inflLevels) <= 0:
             return False
-        curPart = state.inflLevels[-1]['curPart']
-        curInflPos = state.inflLevels[-1]['curPos']
-        curInfl = state.inflLevels[-1]['curInfl']
+        curPart = state.inflLevels[-1].curPart
+        curInflPos = state.inflLevels[-1].curPos
+        curInfl = state.inflLevels[-1].curInfl
         if curPart < len(curInfl.flexParts[0]) and\
            (curInflPos >= len(curInfl.flexParts[0][curPart].flex) or
             ((state.curStemPos < len(state.sl.stem) or state.sl.stem.endswith('.')) and
@@ -466,8 +863,8 @@ class Parser:
         inflexion in the stack. Should be called when current part of
         the inflexion is "." or "[.]".
         """
-        curPart = state.inflLevels[state.curLevel]['curPart']
-        curInfl = state.inflLevels[state.curLevel]['curInfl']
+        curPart = state.inflLevels[state.curLevel].curPart
+        curInfl = state.inflLevels[state.curLevel].curInfl
         if curPart >= len(curInfl.flexParts[0]) or\
            curInfl.flexParts[0][curPart].flex not in ['.', '[.]']:
             return False
@@ -476,15 +873,24 @@ class Parser:
                 return True
             return False
         if curPart == 0 and state.curLevel > 0 and\
-                state.inflLevels[state.curLevel - 1]['curPart'] == 1 and\
-                state.inflLevels[state.curLevel - 1]['curInfl'].flexParts[0][1].flex == '<.>':
+                state.inflLevels[state.curLevel - 1].curPart == 1 and\
+                state.inflLevels[state.curLevel - 1].curInfl.flexParts[0][1].flex == '<.>':
             return False
         if curPart != 0 or (state.curLevel == 0
                             and state.curStemPos < 2 and state.sl.stem.startswith('.')):
             return True
         return False
 
-    def investigate_state(self, state, replacementsAllowed=0):
+    def advance_state(self, state, replacementsAllowed=0, derivationsChecked=False):
+        """
+        Move the state forward until it either fails, yields wordforms
+        or branches. Return a tuple (new states, wordforms, whether the
+        new states are derivational inflexions). In the latter case,
+        the caller has to check if they yielded anything: if they did,
+        the state continues with the next character of the stem,
+        otherwise it continues as if there were no derivations
+        (derivationsChecked=True).
+        """
         while self.continue_loop(state):
             if self.verbose > 1:
                 print(state)
@@ -493,7 +899,7 @@ class Parser:
                 if state.curStemPos >= len(state.sl.stem):
                     if self.verbose > 1:
                         print('Stem ended unexpectedly.')
-                    return []
+                    return [], [], False
                 if state.sl.stem[state.curStemPos] == '.':
                     curLevel = 0
                     state.curStemPos += 1
@@ -501,65 +907,54 @@ class Parser:
                         state.curLevel = 0
                         continue
                     else:
-                        resultingStates = []
+                        newStates = []
                         for infl, para in self.find_inflexions(state, state.sl.paradigm):
                             # print(infl)
-                            newDerivsUsed = []
+                            newDerivsUsed = ()
                             if '#deriv' in para:
-                                newDerivsUsed = [para]
-                            newState = ParseState(state.wf, state.sl, state.wfCorrStart,
-                                                  state.stemCorrStart, state.corrLength,
-                                                  state.inflLevels, curLevel, state.curStemPos,
-                                                  state.curPos, state.derivsUsed + newDerivsUsed,
-                                                  infl)
-                            resultingStates += self.investigate_state(newState, replacementsAllowed=replacementsAllowed)
-                        return resultingStates
-                elif state.curStemPos == 0 and len(state.inflLevels) <= 0:
+                                newDerivsUsed = (para,)
+                            newStates.append(ParseState(state.wf, state.sl, state.wfCorrStart,
+                                                        state.stemCorrStart, state.corrLength,
+                                                        state.inflLevels, curLevel, state.curStemPos,
+                                                        state.curPos, state.derivsUsed + newDerivsUsed,
+                                                        infl))
+                        return newStates, [], False
+                elif state.curStemPos == 0 and len(state.inflLevels) <= 0 and not derivationsChecked:
                     # find derivational inflexions
-                    resultingStates = []
+                    derivationsChecked = True
+                    newStates = []
                     if self.verbose > 1:
                         print('Looking for derivational inflexions...')
                     for infl, para in self.find_inflexions(state, state.sl.paradigm, findDerivations=True):
-                        newDerivsUsed = []
+                        newDerivsUsed = ()
                         if '#deriv' in para:
-                            newDerivsUsed = [para]
-                        newState = ParseState(state.wf, state.sl, state.wfCorrStart,
-                                              state.stemCorrStart, state.corrLength,
-                                              state.inflLevels, 0, state.curStemPos,
-                                              state.curPos, state.derivsUsed + newDerivsUsed,
-                                              infl)
-                        resultingStates += self.investigate_state(newState, replacementsAllowed=replacementsAllowed)
-                    if len(resultingStates) > 0:
-                        if self.verbose > 1:
-                            print(len(resultingStates), 'derivational inflexions found.')
-                        if state.wf[state.curPos] == state.sl.stem[state.curStemPos]:
-                            newState = ParseState(state.wf, state.sl, state.wfCorrStart,
-                                                  state.stemCorrStart, state.corrLength,
-                                                  state.inflLevels, -1, state.curStemPos,
-                                                  state.curPos, state.derivsUsed)
-                            newState.curPos += 1
-                            newState.curStemPos += 1
-                            resultingStates += self.investigate_state(newState, replacementsAllowed=replacementsAllowed)
-                        return resultingStates
+                            newDerivsUsed = (para,)
+                        newStates.append(ParseState(state.wf, state.sl, state.wfCorrStart,
+                                                    state.stemCorrStart, state.corrLength,
+                                                    state.inflLevels, 0, state.curStemPos,
+                                                    state.curPos, state.derivsUsed + newDerivsUsed,
+                                                    infl))
+                    if len(newStates) > 0:
+                        return newStates, [], True
                 if state.stemCorrStart <= state.curStemPos <\
                                 state.stemCorrStart + state.corrLength:
                     if state.curPos != state.wfCorrStart + state.curStemPos -\
                             state.stemCorrStart:
-                        return []
+                        return [], [], False
                 elif state.curPos >= len(state.wf) or\
                      state.curStemPos >= len(state.sl.stem):
                     self.raise_error('Stem or wordform ended unexpectedly: stem=' +
                                      state.sl.stem + ', wf=' + state.wf + '.')
-                    return []
+                    return [], [], False
                 elif (state.wf[state.curPos] != state.sl.stem[state.curStemPos]
                       and (state.wf[state.curPos] != self.WILDCARD and state.sl.stem[state.curStemPos] != self.WILDCARD)):
-                    return []
+                    return [], [], False
                 state.curPos += 1
                 state.curStemPos += 1
             else:
-                curPart = state.inflLevels[state.curLevel]['curPart']
-                curPos = state.inflLevels[state.curLevel]['curPos']
-                curInfl = state.inflLevels[state.curLevel]['curInfl']
+                curPart = state.inflLevels[state.curLevel].curPart
+                curPos = state.inflLevels[state.curLevel].curPos
+                curInfl = state.inflLevels[state.curLevel].curInfl
                 if curPart >= len(curInfl.flexParts[0]):
                     state.curLevel -= 1
                     continue
@@ -570,54 +965,157 @@ class Parser:
                     bSwicthToUpperLevel = self.swicth_to_upper_level(state)
                     if not (state.curStemPos < 2 and state.sl.stem.startswith('.') and
                             curPart == 0 and state.curPos <= -2):
-                        state.inflLevels[state.curLevel]['curPart'] += 1
-                        state.inflLevels[state.curLevel]['curPos'] = 0
+                        level = state.writable_level(state.curLevel)
+                        level.curPart += 1
+                        level.curPos = 0
                     if bSwicthToUpperLevel:
                         state.curLevel -= 1
                     continue
                 elif fp.flex == '<.>':
                     curLevel = state.curLevel + 1
-                    state.inflLevels[state.curLevel]['curPart'] += 1
-                    state.inflLevels[state.curLevel]['curPos'] = 0
+                    level = state.writable_level(state.curLevel)
+                    level.curPart += 1
+                    level.curPos = 0
                     if len(state.inflLevels) > curLevel:
                         state.curLevel = curLevel
                         continue
                     else:
-                        resultingStates = []
+                        newStates = []
                         for pl in curInfl.subsequent:
                             # print(pl.name)
                             for infl, para in self.find_inflexions(state, pl.name):
-                                newDerivsUsed = []
+                                newDerivsUsed = ()
                                 if '#deriv' in para:
-                                    newDerivsUsed = [para]
-                                newState = ParseState(state.wf, state.sl, state.wfCorrStart,
-                                                      state.stemCorrStart, state.corrLength,
-                                                      state.inflLevels, curLevel, state.curStemPos,
-                                                      state.curPos, state.derivsUsed + newDerivsUsed, infl, pl)
-                                resultingStates += self.investigate_state(newState, replacementsAllowed=replacementsAllowed)
-                        return resultingStates
+                                    newDerivsUsed = (para,)
+                                newStates.append(ParseState(state.wf, state.sl, state.wfCorrStart,
+                                                            state.stemCorrStart, state.corrLength,
+                                                            state.inflLevels, curLevel, state.curStemPos,
+                                                            state.curPos, state.derivsUsed + newDerivsUsed,
+                                                            infl, pl))
+                        return newStates, [], False
                 elif curPos >= len(fp.flex):   # or fp.glossType == paradigm.GLOSS_EMPTY:
-                    state.inflLevels[state.curLevel]['curPart'] += 1
-                    state.inflLevels[state.curLevel]['curPos'] = 0
+                    level = state.writable_level(state.curLevel)
+                    level.curPart += 1
+                    level.curPos = 0
                     continue
                 else:
                     if (curPos >= len(fp.flex)
                             or state.curPos >= len(state.wf)
                             or (fp.flex[curPos] != state.wf[state.curPos]
                                 and fp.flex[curPos] != self.WILDCARD and state.wf[state.curPos] != self.WILDCARD)):
-                        return []
+                        return [], [], False
                     state.curPos += 1
-                    state.inflLevels[state.curLevel]['curPos'] += 1
+                    state.writable_level(state.curLevel).curPos += 1
                     continue
         if self.verbose > 1:
             print('End of loop:')
             print(state)
             print('Trying to get a wordform...')
-            print('Inflexions:\n' + '---\n'.join(str(l['curInfl']) for l in state.inflLevels))
+            print('Inflexions:\n' + '---\n'.join(str(l.curInfl) for l in state.inflLevels))
         wf = self.get_wordforms(state, replacementsAllowed=replacementsAllowed)
         if wf is None:
-            return []
-        return wf
+            return [], [], False
+        return [], wf, False
+
+    def investigate_state(self, state, replacementsAllowed=0):
+        """
+        Investigate the state and all the states it leads to.
+        Return a list of Wordform objects.
+        """
+        return self.explore_states([state], replacementsAllowed=replacementsAllowed)
+
+    def explore_states(self, states, replacementsAllowed=0):
+        """
+        Investigate the states and all the states they lead to, depth
+        first, using an explicit stack instead of recursion. Return
+        a list of Wordform objects in the same order as if each state
+        had been investigated recursively.
+        If a state is identical to one that has already been
+        investigated, its wordforms are taken from the first one.
+        At most MAX_PARSE_STATES states are investigated and at most
+        MAX_PARSE_TIME seconds are spent on one call (0 = no limit);
+        after that, only the wordforms found so far are returned.
+        """
+        analyses = []
+        statesDone = {}     # state key -> wordforms it yielded
+        nStates = 0
+        timeLimit = None
+        if self.MAX_PARSE_TIME > 0:
+            timeLimit = time.time() + self.MAX_PARSE_TIME
+        # Stack items: (step, state, step-specific value)
+        stack = [(self.STEP_INVESTIGATE, state, False) for state in reversed(states)]
+        while len(stack) > 0:
+            step, state, value = stack.pop()
+            if step == self.STEP_STATE_DONE:
+                # value = number of analyses before the state was investigated
+                statesDone[state] = analyses[value:]
+                continue
+            elif step == self.STEP_DERIVATIONS_DONE:
+                if len(analyses) <= value:
+                    stack.append((self.STEP_INVESTIGATE, state, True))
+                    continue
+                if self.verbose > 1:
+                    print(len(analyses) - value, 'derivational inflexions found.')
+                if state.wf[state.curPos] == state.sl.stem[state.curStemPos]:
+                    newState = ParseState(state.wf, state.sl, state.wfCorrStart,
+                                          state.stemCorrStart, state.corrLength,
+                                          state.inflLevels, -1, state.curStemPos,
+                                          state.curPos, state.derivsUsed)
+                    newState.curPos += 1
+                    newState.curStemPos += 1
+                    stack.append((self.STEP_INVESTIGATE, newState, False))
+                continue
+            # value = derivations already checked for this state
+            stateKey = None
+            if not value:
+                stateKey = state.key()
+                if stateKey in statesDone:
+                    analyses += statesDone[stateKey]
+                    continue
+            nStates += 1
+            if ((self.MAX_PARSE_STATES > 0 and nStates > self.MAX_PARSE_STATES)
+                    or (timeLimit is not None and time.time() > timeLimit)):
+                self.raise_error('Too many states or too much time for ' + state.wf
+                                 + ', stopped after ' + str(nStates - 1)
+                                 + ' states, some analyses may be missing.')
+                if self.verbose > 0:
+                    print('Too many states or too much time for ' + state.wf
+                          + ', stopped after ' + str(nStates - 1) + ' states.')
+                break
+            newStates, wordforms, bDerivations = self.advance_state(state, replacementsAllowed,
+                                                                    derivationsChecked=value)
+            if len(newStates) <= 0:
+                analyses += wordforms
+                if stateKey is not None:
+                    statesDone[stateKey] = wordforms
+                continue
+            if stateKey is not None:
+                stack.append((self.STEP_STATE_DONE, stateKey, len(analyses)))
+            if bDerivations:
+                stack.append((self.STEP_DERIVATIONS_DONE, state, len(analyses)))
+            for newState in reversed(newStates):
+                stack.append((self.STEP_INVESTIGATE, newState, False))
+        return analyses
+
+    def fill_clitic_tries(self):
+        """
+        Put the stems of the proclitics into a trie and the reversed
+        stems of the enclitics into another one, so that all clitics
+        a word starts or ends with can be found in one pass.
+        The values are tuples (number of the clitic in g.clitics,
+        Clitic object).
+        """
+        self.procliticTrie = StemTrie()
+        self.encliticTrie = StemTrie()
+        for iCl in range(len(self.g.clitics)):
+            cl = self.g.clitics[iCl]
+            if cl.stem is None or len(cl.stem) <= 0:
+                continue
+            if cl.side == SIDE_PROCLITIC:
+                self.procliticTrie.add(cl.stem, [(iCl, cl)])
+            elif cl.side == SIDE_ENCLITIC:
+                self.encliticTrie.add(cl.stem[::-1], [(iCl, cl)])
+        self.nCliticsIndexed = len(self.g.clitics)
 
     def get_hosts(self, word, cliticSide=None, includeSrcWord=True):
         """
@@ -626,53 +1124,67 @@ class Parser:
         the string). If cliticSide is not None, search only for the clitics
         specified by that argument (proclitics or enclitics).
         If there are multiple clitics, list firsth the proclitics and then the
-        enclitics.
+        enclitics. Each combination of clitics and host is listed once.
         """
+        if self.nCliticsIndexed != len(self.g.clitics):
+            self.fill_clitic_tries()
         if includeSrcWord:
             hostsAndClitics = [(None, word)]
         else:
             hostsAndClitics = []
-        for cl in self.g.clitics:
-            if (cl.side == SIDE_ENCLITIC and
-                    cliticSide != SIDE_PROCLITIC and
-                    word.endswith(cl.stem) and
-                    len(word) > len(cl.stem)):
+        combinationsFound = set()
+        for clitics, host in self.split_clitics(word, cliticSide, {}):
+            combination = (tuple(id(cl) for cl in clitics), host)
+            if combination not in combinationsFound:
+                combinationsFound.add(combination)
+                hostsAndClitics.append((clitics, host))
+        return hostsAndClitics
+
+    def split_clitics(self, word, cliticSide, splitsFound):
+        """
+        Return the list of tuples ([Clitic objects], host) for the
+        word, in the order of the clitics in the grammar, without the
+        word itself (see get_hosts()). splitsFound is a dictionary
+        (word, cliticSide) -> result where the results for the hosts
+        that have already been split are kept.
+        """
+        try:
+            return splitsFound[(word, cliticSide)]
+        except KeyError:
+            pass
+        clitics = []
+        if cliticSide != SIDE_PROCLITIC:
+            for stem, stemClitics in self.encliticTrie.prefixes_of(word[::-1]):
+                if len(word) > len(stem):
+                    clitics += stemClitics
+        if cliticSide != SIDE_ENCLITIC:
+            for stem, stemClitics in self.procliticTrie.prefixes_of(word):
+                if len(word) > len(stem):
+                    clitics += stemClitics
+        clitics.sort(key=lambda c: c[0])
+        hostsAndClitics = []
+        for iCl, cl in clitics:
+            if cl.side == SIDE_ENCLITIC:
                 host = word[:-len(cl.stem)]
-                if not cl.is_compatible_str(host):
-                    continue
-                curHost = host
-                curCl = cl
-                if len(host) > 1:
-                    # Try chopping further clitics
-                    furtherHostsAndClitics = self.get_hosts(host,
-                                                            cliticSide=SIDE_ENCLITIC,
-                                                            includeSrcWord=False)
-                    if len(furtherHostsAndClitics) > 0:
-                        for furtherCl, furtherHost in furtherHostsAndClitics:
-                            hostsAndClitics.append((furtherCl + [curCl], furtherHost))
-                    else:
-                        hostsAndClitics.append(([curCl], curHost))
-                else:
-                    hostsAndClitics.append(([curCl], curHost))
-            if (cl.side == SIDE_PROCLITIC and
-                    cliticSide != SIDE_ENCLITIC and
-                    word.startswith(cl.stem) and
-                    len(word) > len(cl.stem)):
+                furtherCliticSide = SIDE_ENCLITIC
+            else:
                 host = word[len(cl.stem):]
-                if not cl.is_compatible_str(host):
-                    continue
-                curHost = host
-                curCl = cl
-                if len(host) > 1:
-                    # Try chopping further clitics
-                    furtherHostsAndClitics = self.get_hosts(host, cliticSide=cliticSide, includeSrcWord=False)
-                    if len(furtherHostsAndClitics) > 0:
-                        for furtherCl, furtherHost in furtherHostsAndClitics:
-                            hostsAndClitics.append(([curCl] + furtherCl, furtherHost))
-                    else:
-                        hostsAndClitics.append(([curCl], curHost))
-                else:
-                    hostsAndClitics.append(([curCl], curHost))
+                furtherCliticSide = cliticSide
+            if not cl.is_compatible_str(host):
+                continue
+            furtherHostsAndClitics = []
+            if len(host) > 1:
+                # Try chopping further clitics
+                furtherHostsAndClitics = self.split_clitics(host, furtherCliticSide, splitsFound)
+            if len(furtherHostsAndClitics) <= 0:
+                hostsAndClitics.append(([cl], host))
+            elif cl.side == SIDE_ENCLITIC:
+                for furtherCl, furtherHost in furtherHostsAndClitics:
+                    hostsAndClitics.append((furtherCl + [cl], furtherHost))
+            else:
+                for furtherCl, furtherHost in furtherHostsAndClitics:
+                    hostsAndClitics.append(([cl] + furtherCl, furtherHost))
+        splitsFound[(word, cliticSide)] = hostsAndClitics
         return hostsAndClitics
 
     def find_stems(self, word, replacementsAllowed=0):
@@ -682,22 +1194,28 @@ class Parser:
         """
         states = []
         if self.parsingMethod == 'hash':
-            for l in range(len(word)):
-                for r in range(l + 1, min(len(word) + 1, l + self.MAX_STEM_START_LEN + 1)):
-                    possibleStem = word[l:r]
-                    try:
-                        suitableSubLex = self.stemStarters[possibleStem]
-                    except KeyError:
-                        continue
-                    if self.verbose > 0:
-                        print('Trying to analyze:', l, r, possibleStem)
-                    for sl in suitableSubLex:
-                        if self.verbose > 1:
-                            print(sl)
-                        state = ParseState(word, sl, l, sl.stem.find(possibleStem), r - l)
-                        states.append(state)
-        elif self.parsingMethod == 'fst':
-            suitableSubLex = self.stemFst.transduce(word, replacementsAllowed=replacementsAllowed)
+            for l, possibleStem, suitableSubLex in self.stemTrie.find_all(word):
+                if self.verbose > 0:
+                    print('Trying to analyze:', l, l + len(possibleStem), possibleStem)
+                for sl in suitableSubLex:
+                    if self.verbose > 1:
+                        print(sl)
+                    state = ParseState(word, sl, l, sl.stem.find(possibleStem), len(possibleStem))
+                    states.append(state)
+        elif self.parsingMethod in ('fst', 'suffix'):
+            if (replacementsAllowed <= 0 and self.stem_prefilter_applies()
+                    and not self.stemTrie.occurs_in(word)):
+                return states
+            if replacementsAllowed > 0 and self.stem_index_applies(replacementsAllowed):
+                suitableSubLex = self.stemIndex.lookup(word, replacementsAllowed=replacementsAllowed,
+                                                       maxSteps=self.MAX_FUZZY_STEPS)
+            elif replacementsAllowed > 0:
+                suitableSubLex = self.get_fuzzy_lookup().lookup(word, replacementsAllowed=replacementsAllowed)
+            elif self.suffixLookup is not None:
+                suitableSubLex = self.suffixLookup.transduce(word)
+            else:
+                suitableSubLex = self.stemFst.transduce(word)
+            rxStemParts = {}    # stem substring with wildcards -> compiled regex
             for l, r, sl, repl in suitableSubLex:
                 # print(word, sl.stem, replacementsAllowed, l, r)
                 # print(replacementsAllowed, r - l + 1, self.MIN_REPLACEMENT_STEM_LEN, sl.stem)
@@ -726,8 +1244,13 @@ class Parser:
                     state = ParseState(wordReplaced, sl, l, sl.stem.find(wordReplaced[l:r+1]), r - l + 1)
                 else:
                     matchPosition = -1
-                    substringReplaced = re.escape(wordReplaced[l:r + 1 + addLen]).replace(self.WILDCARD, '.')
-                    m = re.search(substringReplaced, sl.stem)
+                    substringReplaced = wordReplaced[l:r + 1 + addLen]
+                    try:
+                        rxStemPart = rxStemParts[substringReplaced]
+                    except KeyError:
+                        rxStemPart = re.compile(re.escape(substringReplaced).replace(self.WILDCARD, '.'))
+                        rxStemParts[substringReplaced] = rxStemPart
+                    m = rxStemPart.search(sl.stem)
                     if m is not None:
                         matchPosition = m.start(0)
                     state = ParseState(wordReplaced, sl, l, matchPosition, r - l + 1 + addLen)
@@ -736,6 +1259,34 @@ class Parser:
                 states.append(state)
         return states
 
+    def get_fuzzy_lookup(self):
+        """
+        Return the FuzzyStemLookup for the current stem FST.
+        """
+        if self.fuzzyLookup is None or self.fuzzyLookup.fst is not self.stemFst:
+            self.fuzzyLookup = FuzzyStemLookup(self.stemFst, maxSteps=self.MAX_FUZZY_STEPS,
+                                               verbose=self.verbose)
+        return self.fuzzyLookup
+
+    def stem_prefilter_applies(self):
+        """
+        Check if the words can be checked for stem starts before
+        the stem FST is used. This is only possible if FST_STEM_PREFILTER
+        was already on when the stems were added to the FST.
+        """
+        return self.FST_STEM_PREFILTER and self.stemPrefilterFilled
+
+    def stem_index_applies(self, replacementsAllowed):
+        """
+        Check if the stems with the given number of replacements
+        can be searched for with the DeletionStemIndex. (Words that
+        match rxNoReplacements never get that far, see parse_host().)
+        """
+        if self.stemIndex is None or replacementsAllowed > self.stemIndex.maxDistance:
+            return False
+        # Stems shorter than the minimal length are not indexed
+        return self.MIN_REPLACEMENT_STEM_LEN >= self.stemIndex.minStemLen
+
     def is_bad_analysis(self, analyses, i_ana):
         """
         Check if the analysis with the index i_ana in the list of
@@ -757,20 +1308,33 @@ class Parser:
                 return True
         return False
 
+    def get_bad_analysis_index(self):
+        """
+        Return the BadAnalysisIndex for the current templates of the
+        grammar. If the templates have changed since the index was
+        built, build it again and forget the analyses of the hosts
+        made with the old templates.
+        """
+        if (self.badAnalysisIndex is None
+                or not self.badAnalysisIndex.is_built_from(self.g)):
+            self.badAnalysisIndex = BadAnalysisIndex(self.g.badAnalyses,
+                                                     self.g.badAnalysesConditional)
+            self.hostCache.clear()
+        return self.badAnalysisIndex
+
     def investigate_states(self, states, replacementsAllowed=0):
         """
         Investigate all states corresponding to the stems found by the stem FST.
         Return a set of all possible analyses.
         """
-        analyses = []
         if self.verbose > 0:
             print('Start investigating states...')
-        for state in states:
-            analyses += self.investigate_state(state, replacementsAllowed=replacementsAllowed)
+        analyses = self.explore_states(states, replacementsAllowed=replacementsAllowed)
         analysesSet = set()
+        badAnalyses = self.get_bad_analysis_index().find_bad(analyses)
         for i in range(len(analyses)):
             ana = analyses[i]
-            if self.is_bad_analysis(analyses, i):
+            if badAnalyses[i]:
                 continue
             enhancedAnas = self.apply_lex_rules(ana)
             if len(enhancedAnas) <= 0:
@@ -805,45 +1369,98 @@ class Parser:
         # print(t2 - t1, 'seconds for analyzing.')
         return analysesSet
 
+    def get_host_analyses(self, host, replacementsAllowed=0, hostsAnalyzed=None):
+        """
+        Return a list with copies of the analyses parse_host() makes
+        for the host. If the host has already been analyzed, either
+        for the same token (hostsAnalyzed is a dictionary where
+        the analyses are kept during one call of parse()) or for
+        another one (if REMEMBER_HOSTS is True), the analyses are taken
+        from there. The stored Wordform objects are never returned
+        themselves, so the caller can add clitics to the copies.
+        The shared cache is emptied when the stems or affixes are
+        reloaded or the templates of bad analyses change; the settings
+        that affect the search with replacements (see replacement_settings())
+        are part of the key.
+        """
+        key = (host, replacementsAllowed, self.replacement_settings(replacementsAllowed))
+        hostAnalyses = None
+        if hostsAnalyzed is not None:
+            hostAnalyses = hostsAnalyzed.get(key)
+        if hostAnalyses is None and self.REMEMBER_HOSTS:
+            # The cached analyses are dropped if the templates of bad analyses have changed
+            self.get_bad_analysis_index()
+            hostAnalyses = self.hostCache.get(key)
+        if hostAnalyses is None:
+            hostAnalyses = tuple(self.parse_host(host, replacementsAllowed=replacementsAllowed))
+            if self.REMEMBER_HOSTS:
+                self.hostCache.put(key, hostAnalyses)
+        if hostsAnalyzed is not None:
+            hostsAnalyzed[key] = hostAnalyses
+        return Parser.copy_analyses(hostAnalyses)
+
     def apply_lex_rules(self, ana):
+        """
+        Return the set of copies of the analysis with the fields added
+        by each lexical rule that applies to it.
+        """
         possibleEnhancements = set()
+        rules = []
         if ana.lemma in self.g.lexRulesByLemma:
-            for rule in self.g.lexRulesByLemma[ana.lemma]:
-                newAna = rule.apply(ana)
-                if newAna is not None:
-                    possibleEnhancements.add(newAna)
+            rules += self.g.lexRulesByLemma[ana.lemma]
         if ana.stem in self.g.lexRulesByStem:
-            for rule in self.g.lexRulesByStem[ana.stem]:
-                newAna = rule.apply(ana)
-                if newAna is not None:
-                    possibleEnhancements.add(newAna)
+            rules += self.g.lexRulesByStem[ana.stem]
+        if len(rules) <= 0:
+            return possibleEnhancements
+        # The otherData fields are grouped once for all rules
+        otherValues = LexRule.other_values(ana)
+        for rule in rules:
+            newAna = rule.apply(ana, otherValues)
+            if newAna is not None:
+                possibleEnhancements.add(newAna)
         return possibleEnhancements
 
-    def parse(self, word, printOut=False, replacementsAllowed=0):
+    def parse(self, word, printOut=False, replacementsAllowed=0, glossing=True):
         """
         Return a list of Wordform objects, each representing a possible
         analysis of the word string.
+        glossing only matters if a persistent cache is used: if it is False,
+        the analyses are stored there and returned without glosses.
         """
         analyses = []
         word = Parser.rxCleanToken.sub('', word)
         if self.REMEMBER_PARSES:
-            try:
-                analyses = self.dictParses[word]
+            cachedAnalyses = self.parseCache.get((word, replacementsAllowed))
+            if cachedAnalyses is not None:
                 if self.verbose > 0:
                     print(word, 'was found in the cache.')
-                return analyses
-            except KeyError:
-                pass
+                return Parser.copy_analyses(cachedAnalyses)
         if len(word) <= 0 or len(word) > Parser.MAX_TOKEN_LENGTH:
             return analyses
+        if self.diskCache is not None:
+            cachedAnalyses = self.diskCache.get(self.g, word,
+                                                replacementsAllowed=replacementsAllowed,
+                                                glossing=glossing,
+                                                settings=self.replacement_settings(replacementsAllowed))
+            if cachedAnalyses is not None:
+                if self.verbose > 0:
+                    print(word, 'was found in the persistent cache.')
+                if self.REMEMBER_PARSES and glossing:
+                    # Analyses stored without glosses cannot be reused
+                    # by calls with glossing=True
+                    self.parseCache.put((word, replacementsAllowed), tuple(cachedAnalyses))
+                    return Parser.copy_analyses(cachedAnalyses)
+                return cachedAnalyses
 
         if self.verbose > 0:
             print(word, ': start searching for clitics...')
         hostsAndClitics = self.get_hosts(word)
         if self.verbose > 1:
             print(len(hostsAndClitics), 'possible variants of splitting into a host and a clitic.')
+        hostsAnalyzed = {}
         for clitics, host in hostsAndClitics:
-            hostAnalyses = self.parse_host(host, replacementsAllowed=replacementsAllowed)
+            hostAnalyses = self.get_host_analyses(host, replacementsAllowed=replacementsAllowed,
+                                                  hostsAnalyzed=hostsAnalyzed)
             if len(hostAnalyses) <= 0:
                 continue
             for wf in hostAnalyses:
@@ -873,8 +1490,13 @@ class Parser:
                 for ana in analyses:
                     print('****************\n')
                     print(ana)
+        if self.diskCache is not None:
+            self.diskCache.put(word, analyses, replacementsAllowed=replacementsAllowed,
+                               glossing=glossing,
+                               settings=self.replacement_settings(replacementsAllowed))
         if self.REMEMBER_PARSES:
-            self.dictParses[word] = analyses
+            self.parseCache.put((word, replacementsAllowed), tuple(analyses))
+            return Parser.copy_analyses(analyses)
         return analyses
 
     @staticmethod
@@ -884,14 +1506,126 @@ class Parser:
             r += ana
         return r + token + '</w>'
 
+    def parse_chunk(self, tokens, glossing=False, replacementsAllowed=0):
+        """
+        Analyze a list of tokens. Return a list where each token
+        corresponds either to the XML with its analyses, or to None
+        if it could not be analyzed.
+        """
+        result = []
+        for token in tokens:
+            analyses = self.parse(token, replacementsAllowed=replacementsAllowed,
+                                  glossing=glossing)
+            if len(analyses) <= 0:
+                result.append(None)
+            else:
+                result.append(Parser.ana2xml(token, analyses, glossing=glossing))
+        if self.diskCache is not None:
+            self.diskCache.commit()
+        return result
+
+    def parse_chunks_parallel(self, chunks, nWorkers, glossing=False, replacementsAllowed=0):
+        """
+        Analyze chunks of (token, frequency) tuples in nWorkers forked
+        processes. The processes share the grammar and the FSTs with
+        the current process. Yield tuples (chunk, results of parse_chunk())
+        in the original order of the chunks. Only a few chunks per worker
+        are read in advance, so that the memory consumption does not
+        depend on the number of chunks.
+        """
+        global _forkedParser
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except ValueError:
+            self.raise_error('Forking processes is not supported on this platform, '
+                             'the frequency list will be processed in one process.')
+            for chunk in chunks:
+                yield chunk, self.parse_chunk([token for token, freq in chunk], glossing=glossing,
+                                              replacementsAllowed=replacementsAllowed)
+            return
+        _forkedParser = self
+        if self.diskCache is not None:
+            self.diskCache.commit()
+        try:
+            with ctx.Pool(nWorkers) as pool:
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append((chunk, pool.apply_async(_parse_chunk_forked,
+                                                            (([token for token, freq in chunk],
+                                                              glossing, replacementsAllowed),))))
+                    if len(pending) >= 2 * nWorkers:
+                        chunk, result = pending.popleft()
+                        yield chunk, result.get()
+                while len(pending) > 0:
+                    chunk, result = pending.popleft()
+                    yield chunk, result.get()
+        finally:
+            _forkedParser = None
+
+    @staticmethod
+    def read_freq_list(fIn, sep=':', maxLines=None):
+        """
+        Iterate over the (token, frequency) tuples from an open frequency
+        list file. Raise ValueError if a line has wrong format.
+        """
+        nLines = 0
+        for line in fIn:
+            if len(line) <= 2:
+                continue
+            if maxLines is not None and nLines >= maxLines:
+                break
+            x = line.split(sep)
+            yield x[0].strip(), int(x[1].strip())
+            nLines += 1
+
+    def sort_freq_list(self, lines):
+        """
+        Sort an iterable of (token, frequency) tuples by descending frequency
+        and return an iterator over the sorted tuples. If there are more
+        than MAX_SORT_LINES_IN_MEMORY tuples, use external merge sort
+        with temporary files.
+        """
+        sortKey = lambda x: (-x[1], x[0])
+        runs = []
+        curRun = []
+        for line in lines:
+            curRun.append(line)
+            if len(curRun) >= self.MAX_SORT_LINES_IN_MEMORY:
+                curRun.sort(key=sortKey)
+                fRun = tempfile.TemporaryFile('w+', encoding='utf-8')
+                for token, freq in curRun:
+                    fRun.write(str(freq) + '\t' + token + '\n')
+                fRun.seek(0)
+                runs.append(fRun)
+                curRun = []
+        curRun.sort(key=sortKey)
+        if len(runs) <= 0:
+            return iter(curRun)
+
+        def read_run(fRun):
+            for line in fRun:
+                freq, token = line.rstrip('\n').split('\t', 1)
+                yield token, int(freq)
+            fRun.close()
+
+        return heapq.merge(*([read_run(fRun) for fRun in runs] + [curRun]), key=sortKey)
+
     def parse_freq_list(self, fnameIn, sep=':', fnameParsed='', fnameUnparsed='',
-                        maxLines=None, glossing=False, replacementsAllowed=0):
+                        maxLines=None, glossing=False, replacementsAllowed=0,
+                        nWorkers=1, sortByFreq=True):
         """
         Analyze a frequency list of tokens. Write analyses to fnameParsed
         and unanalyzed tokens to fnameUnparsed. Return total number of tokens
         and the rate of the parsed tokens (taking their frequencies into account).
         If maxLines is not None, process only the first maxLines of the
         frequency list.
+        If nWorkers > 1, analyze the tokens in that many forked processes.
+        The list is processed in chunks, and the output files grow as the
+        analysis proceeds. If sortByFreq is True, the tokens are analyzed
+        and written in the order of descending frequency, which requires
+        reading the whole list first (lists larger than MAX_SORT_LINES_IN_MEMORY
+        are sorted with the help of temporary files). Otherwise, the original
+        order is kept and the list is never read into memory as a whole.
         """
         if len(fnameParsed) <= 0:
             fnameParsed = fnameIn + '-parsed.txt'
@@ -899,73 +1633,132 @@ class Parser:
             fnameUnparsed = fnameIn + '-unparsed.txt'
         try:
             fIn = open(fnameIn, 'r', encoding='utf-8-sig')
-            lines = [(x[0].strip(), int(x[1].strip()))
-                     for x in [line.split(sep) for line in fIn if len(line) > 2]]
-            fIn.close()
         except IOError:
             self.raise_error('The frequency list could not be opened.')
             return 0, 0.0
-        except ValueError:
-            self.raise_error('Wrong format of the frequency list.')
-            return 0, 0.0
-        if maxLines is not None:
-            lines = lines[:maxLines]
+        lines = self.read_freq_list(fIn, sep=sep, maxLines=maxLines)
+        if sortByFreq:
+            try:
+                lines = self.sort_freq_list(lines)
+            except ValueError:
+                self.raise_error('Wrong format of the frequency list.')
+                fIn.close()
+                return 0, 0.0
+
+        def make_chunks():
+            chunk = []
+            for line in lines:
+                chunk.append(line)
+                if len(chunk) >= self.WORKER_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+            if len(chunk) > 0:
+                yield chunk
+
+        if nWorkers is not None and nWorkers > 1:
+            results = self.parse_chunks_parallel(make_chunks(), nWorkers, glossing=glossing,
+                                                 replacementsAllowed=replacementsAllowed)
+        else:
+            results = ((chunk, self.parse_chunk([token for token, freq in chunk], glossing=glossing,
+                                                replacementsAllowed=replacementsAllowed))
+                       for chunk in make_chunks())
+        nTokens = 0
         parsedTokenFreqs = 0
         unparsedTokenFreqs = 0
         fParsed = open(fnameParsed, 'w', encoding='utf-8')
         fUnparsed = open(fnameUnparsed, 'w', encoding='utf-8')
-        for (token, freq) in sorted(lines, key=lambda x: (-x[1], x[0])):
-            analyses = self.parse(token, replacementsAllowed=replacementsAllowed)
-            if len(analyses) <= 0:
-                fUnparsed.write(token + '\n')
-                unparsedTokenFreqs += freq
-            else:
-                fParsed.write(Parser.ana2xml(token, analyses, glossing=glossing) + '\n')
-                parsedTokenFreqs += freq
-        fParsed.close()
-        fUnparsed.close()
-        return len(lines), parsedTokenFreqs / (parsedTokenFreqs + unparsedTokenFreqs)
+        try:
+            for chunk, result in results:
+                for (token, freq), xmlAna in zip(chunk, result):
+                    if xmlAna is None:
+                        fUnparsed.write(token + '\n')
+                        unparsedTokenFreqs += freq
+                    else:
+                        fParsed.write(xmlAna + '\n')
+                        parsedTokenFreqs += freq
+                nTokens += len(chunk)
+                fParsed.flush()
+                fUnparsed.flush()
+                if self.verbose > 0:
+                    print(nTokens, 'tokens processed,',
+                          parsedTokenFreqs * 100 / max(1, parsedTokenFreqs + unparsedTokenFreqs),
+                          '% tokens parsed.')
+        except ValueError:
+            self.raise_error('Wrong format of the frequency list (line ' +
+                             str(nTokens + 1) + ' or later).')
+        finally:
+            fIn.close()
+            fParsed.close()
+            fUnparsed.close()
+        if parsedTokenFreqs + unparsedTokenFreqs <= 0:
+            return nTokens, 0.0
+        return nTokens, parsedTokenFreqs / (parsedTokenFreqs + unparsedTokenFreqs)
+
+    def iterate_text_tokens(self, fIn):
+        """
+        Iterate over whitespace-separated tokens in an open text file,
+        reading it by blocks of TEXT_BLOCK_SIZE characters.
+        """
+        tail = ''
+        while True:
+            block = fIn.read(self.TEXT_BLOCK_SIZE)
+            if len(block) <= 0:
+                break
+            tokens = (tail + block).split()
+            tail = ''
+            if len(tokens) > 0 and not block[-1].isspace():
+                # The last token may continue in the next block
+                tail = tokens.pop()
+            for token in tokens:
+                yield token
+        if len(tail) > 0:
+            yield tail
 
     def parse_txt(self, fnameIn, fnameOut='', encoding='utf-8-sig',
                   glossing=False, replacementsAllowed=0):
         """
         Analyze a text file fnameIn. Write the processed text to fnameOut.
         Return total number of tokens and number of the parsed tokens.
+        The text is read and written token by token, so the file
+        is never loaded into memory as a whole.
         """
-        self.REMEMBER_PARSES = True
         if len(fnameOut) <= 0:
             fnameOut = fnameIn + '-processed.xml'
         try:
             fIn = open(fnameIn, 'r', encoding=encoding)
-            text = fIn.read()
-            processedText = '<text>\n'
-            fIn.close()
         except IOError:
             self.raise_error('The text file ' + fnameIn + ' could not be opened.')
             return 0, 0
-        rawTokens = text.split()
         wordsAnalyzed = totalWords = 0
-        for token in rawTokens:
-            if len(token) <= 0:
-                continue
-            m = self.rxTokenSearch.search(token)
-            processedText += ' '
-            if m is None:
-                processedText += token
-                continue
-            puncl = m.group(1)
-            wf = m.group(2)
-            puncr = m.group(3)
-            processedText += puncl
-            if len(wf) > 0:
-                anas = self.parse(wf.lower(), replacementsAllowed=replacementsAllowed)
-                if len(anas) > 0:
-                    wordsAnalyzed += 1
-                processedText += Parser.ana2xml(wf, anas, glossing=glossing)
-                totalWords += 1
-            processedText += puncr + '\n'
-        processedText += '</text>'
-        fOut = open(fnameOut, 'w', encoding='utf-8')
-        fOut.write(processedText)
-        fOut.close()
+        rememberParses = self.REMEMBER_PARSES
+        self.REMEMBER_PARSES = True
+        try:
+            with fIn, open(fnameOut, 'w', encoding='utf-8') as fOut:
+                fOut.write('<text>\n')
+                for token in self.iterate_text_tokens(fIn):
+                    m = self.rxTokenSearch.search(token)
+                    if m is None:
+                        fOut.write(' ' + token)
+                        continue
+                    puncl = m.group(1)
+                    wf = m.group(2)
+                    puncr = m.group(3)
+                    fOut.write(' ' + puncl)
+                    if len(wf) > 0:
+                        anas = self.parse(wf.lower(), replacementsAllowed=replacementsAllowed,
+                                          glossing=glossing)
+                        if len(anas) > 0:
+                            wordsAnalyzed += 1
+                        fOut.write(Parser.ana2xml(wf, anas, glossing=glossing))
+                        totalWords += 1
+                    fOut.write(puncr + '\n')
+                fOut.write('</text>')
+        finally:
+            self.REMEMBER_PARSES = rememberParses
+            if self.diskCache is not None:
+                self.diskCache.commit()
+        if self.verbose > 0:
+            print('Parse cache:', self.parseCache.stats())
+            print('Inflexion cache:', self.inflexionCache.stats())
+            print('Host cache:', self.hostCache.stats())
         return totalWords, wordsAnalyzed
@@ -0,0 +1,265 @@
+import collections
+from .morph_fst import MorphFST
+from .fuzzy_lookup import FuzzyStemLookup
+
+
+class DeletionStemIndex:
+    """
+    Symmetric deletion index (as in SymSpell) of the stems used for
+    searching stems with replacements ('fst' parsing method).
+    Each stem consisting of one part (e.g. "kniga" or ".kniga.",
+    but not ".kn.ga.") is stored under every string that can be
+    obtained from it by deleting up to maxDistance characters. If a
+    substring of the token differs from the stem by at most k
+    substitutions, insertions, deletions and swaps of adjacent
+    characters, both can be reduced to the same string by at most k
+    deletions, so all such stems can be found by hash lookups.
+    The candidates are then put into a small FST and searched
+    with FuzzyStemLookup, which gives the same results as the search
+    in the FST with all the stems. Stems that consist of several
+    parts are kept in a separate (residual) FST which is always
+    searched in full.
+    Stems shorter than minStemLen - maxDistance are not indexed at all,
+    because they cannot be found with replacements (see
+    Parser.MIN_REPLACEMENT_STEM_LEN).
+    """
+    MAX_DISTANCE = 2
+
+    def __init__(self, g, maxDistance=None, minStemLen=0, verbose=0):
+        self.g = g
+        self.maxDistance = maxDistance
+        if self.maxDistance is None:
+            self.maxDistance = self.MAX_DISTANCE
+        self.minStemLen = minStemLen
+        self.verbose = verbose
+        self.stems = []         # stem number -> (prepared stem, sublexeme)
+        self.stemParts = []     # stem number -> (stem without dots, can start inside the token,
+                                #                 can end inside the token)
+        self.variants = {}      # deletion variant -> [stem numbers]
+        self.stemLengths = set()
+        self.residualFst = MorphFST(self.g, verbose=self.verbose)
+
+    def __len__(self):
+        return len(self.stems)
+
+    @staticmethod
+    def deletion_variants(s, maxDeletions):
+        """
+        Return the set of strings that can be obtained from s
+        by deleting at most maxDeletions characters.
+        """
+        variants = {s}
+        curVariants = {s}
+        for _ in range(maxDeletions):
+            nextVariants = set()
+            for v in curVariants:
+                for i in range(len(v)):
+                    nextVariants.add(v[:i] + v[i+1:])
+            variants |= nextVariants
+            curVariants = nextVariants
+        return variants
+
+    def add_stem(self, sl):
+        """
+        Add a SubLexeme object to the index or, if its stem
+        consists of several parts, to the residual FST.
+        """
+        stem = self.residualFst.prepare_stem(sl.stem)
+        stemPart = stem.strip('.')
+        if '.' in stemPart or len(stemPart) <= 0:
+            self.residualFst.add_stem(sl)
+            return
+        if len(stemPart) < self.minStemLen - self.maxDistance:
+            return
+        stemNum = len(self.stems)
+        self.stems.append((stem, sl))
+        self.stemParts.append((stemPart, stem.startswith('.'), stem.endswith('.')))
+        self.stemLengths.add(len(stemPart))
+        for v in DeletionStemIndex.deletion_variants(stemPart, self.maxDistance):
+            try:
+                self.variants[v].append(stemNum)
+            except KeyError:
+                self.variants[v] = [stemNum]
+
+    def find_candidates(self, token, replacementsAllowed):
+        """
+        Return the sorted list of numbers of the indexed stems
+        that may be found in the token with at most
+        replacementsAllowed replacements.
+        """
+        candidates = set()
+        rejected = set()
+        if len(self.stemLengths) <= 0:
+            return []
+        minLen = max(1, min(self.stemLengths) - replacementsAllowed)
+        maxLen = max(self.stemLengths) + replacementsAllowed
+        for start in range(len(token)):
+            for end in range(start + minLen, min(len(token), start + maxLen) + 1):
+                for v in DeletionStemIndex.deletion_variants(token[start:end], replacementsAllowed):
+                    if v not in self.variants:
+                        continue
+                    for stemNum in self.variants[v]:
+                        if stemNum in candidates or stemNum in rejected:
+                            continue
+                        stemPart, startsInside, endsInside = self.stemParts[stemNum]
+                        if len(stemPart) + replacementsAllowed < self.minStemLen:
+                            rejected.add(stemNum)
+                        elif abs(len(stemPart) - (end - start)) > replacementsAllowed:
+                            continue
+                        elif (start == 0 or startsInside) and (end == len(token) or endsInside):
+                            candidates.add(stemNum)
+        return sorted(candidates)
+
+    def lookup(self, token, replacementsAllowed=1, maxSteps=None):
+        """
+        Return the list of stems found in the token with at most
+        replacementsAllowed replacements, in the format of
+        MorphFST.transduce(): tuples (l, r, sublexeme, replacements).
+        """
+        fst = MorphFST(self.g)
+        for stemNum in self.find_candidates(token, replacementsAllowed):
+            stem, sl = self.stems[stemNum]
+            fst.add_string(stem, sl)
+        result = FuzzyStemLookup(fst, maxSteps=maxSteps,
+                                 verbose=self.verbose).lookup(token, replacementsAllowed)
+        result += FuzzyStemLookup(self.residualFst, maxSteps=maxSteps,
+                                  verbose=self.verbose).lookup(token, replacementsAllowed)
+        return result
+
+    def freeze(self):
+        """
+        Replace the residual FST with its compact version.
+        """
+        self.residualFst = self.residualFst.freeze()
+
+
+class StemTrie:
+    """
+    Aho-Corasick automaton over stem starters: the first non-empty
+    parts of the stems, each with the list of sublexemes whose stems
+    start with it. All occurrences of the starters in a word are
+    found in one left-to-right pass over the word.
+    The failure links are computed before the first search and
+    whenever new starters have been added.
+    """
+
+    def __init__(self):
+        self.children = [{}]    # node number -> {character: node number}
+        self.keys = [None]      # node number -> starter that ends there, if any
+        self.values = [None]    # node number -> [sublexemes]
+        self.fail = None        # node number -> node of its longest proper suffix
+        self.outputLinks = None # node number -> next node with a starter on the failure chain, or 0
+
+    def __len__(self):
+        return sum(1 for k in self.keys if k is not None)
+
+    def add(self, key, values):
+        """
+        Add the sublexemes to the list stored under the key.
+        Sublexemes that are already there are not added again.
+        """
+        self.fail = self.outputLinks = None
+        node = 0
+        for c in key:
+            try:
+                node = self.children[node][c]
+            except KeyError:
+                self.children[node][c] = len(self.children)
+                node = len(self.children)
+                self.children.append({})
+                self.keys.append(None)
+                self.values.append(None)
+        if self.values[node] is None:
+            self.keys[node] = key
+            self.values[node] = []
+        storedIDs = set(id(v) for v in self.values[node])
+        for v in values:
+            if id(v) not in storedIDs:
+                self.values[node].append(v)
+                storedIDs.add(id(v))
+
+    def build_links(self):
+        """
+        Compute the failure links and the output links (breadth first).
+        """
+        self.fail = [0] * len(self.children)
+        self.outputLinks = [0] * len(self.children)
+        nodesToCheck = collections.deque(self.children[0].values())
+        while len(nodesToCheck) > 0:
+            node = nodesToCheck.popleft()
+            for c, child in self.children[node].items():
+                nodesToCheck.append(child)
+                suffixNode = self.fail[node]
+                while suffixNode > 0 and c not in self.children[suffixNode]:
+                    suffixNode = self.fail[suffixNode]
+                if node > 0 and c in self.children[suffixNode]:
+                    suffixNode = self.children[suffixNode][c]
+                self.fail[child] = suffixNode
+                if self.keys[suffixNode] is not None and suffixNode > 0:
+                    self.outputLinks[child] = suffixNode
+                else:
+                    self.outputLinks[child] = self.outputLinks[suffixNode]
+
+    def find_all(self, s):
+        """
+        Return the list of tuples (start, starter, [sublexemes])
+        for all occurrences of the starters in s, sorted by
+        the start position and then by length.
+        """
+        if self.fail is None:
+            self.build_links()
+        result = []
+        children, fail, keys = self.children, self.fail, self.keys
+        node = 0
+        for i in range(len(s)):
+            c = s[i]
+            while node > 0 and c not in children[node]:
+                node = fail[node]
+            node = children[node].get(c, 0)
+            outNode = node
+            if keys[outNode] is None:
+                outNode = self.outputLinks[outNode]
+            while outNode > 0:
+                key = keys[outNode]
+                result.append((i + 1 - len(key), key, self.values[outNode]))
+                outNode = self.outputLinks[outNode]
+        result.sort(key=lambda occurrence: (occurrence[0], len(occurrence[1])))
+        return result
+
+    def prefixes_of(self, s):
+        """
+        Return the list of tuples (key, [values]) for all non-empty
+        keys s starts with, shortest first.
+        """
+        result = []
+        node = 0
+        for c in s:
+            node = self.children[node].get(c)
+            if node is None:
+                break
+            if self.keys[node] is not None:
+                result.append((self.keys[node], self.values[node]))
+        return result
+
+    def occurs_in(self, s):
+        """
+        Check if at least one of the starters occurs in s.
+        """
+        if self.keys[0] is not None:
+            # Empty starter
+            return True
+        if self.fail is None:
+            self.build_links()
+        node = 0
+        for c in s:
+            while node > 0 and c not in self.children[node]:
+                node = self.fail[node]
+            node = self.children[node].get(c, 0)
+            if node > 0 and (self.keys[node] is not None or self.outputLinks[node] > 0):
+                return True
+        return False
+
+    def items(self):
+        for node in range(len(self.keys)):
+            if self.keys[node] is not None:
+                yield self.keys[node], self.values[node]
@@ -0,0 +1,162 @@
+from .morph_fst import MorphFST
+
+
+class SuffixFirstLookup:
+    """
+    Stem lookup for the 'suffix' parsing method. Instead of walking
+    the stem FST from every position of the word, it first finds the
+    possible endings of the word with a reversed automaton built from
+    all affixes and labelled with paradigm names, and then looks up
+    only the remaining stem strings in a hash table.
+    An ending of a paradigm is any non-empty part of an inflexion
+    that can be used with that paradigm (directly or through the
+    paradigms its inflexions link to). In a correct analysis, the
+    word ends either with the stem or with one of such parts, so a
+    stem can only be followed by the ending of its own paradigm.
+    Only stems that consist of one part (e.g. "kniga" or ".kniga.")
+    are kept in the hash table; the rest are looked up in a residual
+    FST. The results are the same as those of MorphFST.transduce()
+    for the stem FST, except that stems which cannot be followed
+    by any ending of their paradigm are not returned.
+    """
+
+    def __init__(self, g, verbose=0):
+        self.g = g
+        self.verbose = verbose
+        self.stems = {}                 # stem without dots -> [(sublexeme, can start inside
+                                        #                       the word, can end inside the word)]
+        self.stemLengths = set()
+        self.endingTrie = [{}]          # reversed endings: node number -> {character: node number}
+        self.endingParadigms = [None]   # node number -> paradigm names whose ending ends there
+        self.residualFst = MorphFST(self.g, verbose=self.verbose)
+
+    def add_stem(self, sl):
+        """
+        Add a SubLexeme object to the hash table or, if its stem
+        consists of several parts, to the residual FST.
+        """
+        stem = self.residualFst.prepare_stem(sl.stem)
+        stemPart = stem.strip('.')
+        if '.' in stemPart or len(stemPart) <= 0:
+            self.residualFst.add_stem(sl)
+            return
+        try:
+            self.stems[stemPart].append((sl, stem.startswith('.'), stem.endswith('.')))
+        except KeyError:
+            self.stems[stemPart] = [(sl, stem.startswith('.'), stem.endswith('.'))]
+        self.stemLengths.add(len(stemPart))
+
+    def linked_paradigms(self, paraName):
+        """
+        Return the set of names of the paradigms whose inflexions
+        can be used in a word with the stem of the given paradigm.
+        """
+        result = set()
+        parasToCheck = [paraName]
+        while len(parasToCheck) > 0:
+            curParaName = parasToCheck.pop()
+            if curParaName in result or curParaName not in self.g.paradigms:
+                continue
+            result.add(curParaName)
+            for infl in self.g.paradigms[curParaName].flex:
+                for pl in infl.subsequent:
+                    parasToCheck.append(pl.name)
+        return result
+
+    @staticmethod
+    def paradigm_endings(para):
+        """
+        Return the set of non-empty parts of the inflexions
+        of the paradigm.
+        """
+        endings = set()
+        for infl in para.flex:
+            if len(infl.flexParts) <= 0:
+                continue
+            for fp in infl.flexParts[0]:
+                if len(fp.flex) > 0 and fp.flex not in ('.', '[.]', '<.>'):
+                    endings.add(fp.flex)
+        return endings
+
+    def fill_endings(self):
+        """
+        Build the reversed automaton of the endings of all paradigms.
+        Should be called after the paradigms have been compiled.
+        """
+        self.endingTrie = [{}]
+        self.endingParadigms = [None]
+        endingsByPara = {paraName: SuffixFirstLookup.paradigm_endings(para)
+                         for paraName, para in self.g.paradigms.items()}
+        for paraName in self.g.paradigms:
+            endings = set()
+            for linkedParaName in self.linked_paradigms(paraName):
+                endings |= endingsByPara[linkedParaName]
+            for ending in endings:
+                node = 0
+                for c in reversed(ending):
+                    try:
+                        node = self.endingTrie[node][c]
+                    except KeyError:
+                        self.endingTrie[node][c] = len(self.endingTrie)
+                        node = len(self.endingTrie)
+                        self.endingTrie.append({})
+                        self.endingParadigms.append(None)
+                if self.endingParadigms[node] is None:
+                    self.endingParadigms[node] = set()
+                self.endingParadigms[node].add(paraName)
+        if self.verbose > 0:
+            print('Endings automaton filled:', len(self.endingTrie), 'states.')
+
+    def find_endings(self, word):
+        """
+        Return a dictionary paradigm name -> the rightmost position
+        where one of the endings of that paradigm starts, if the
+        word ends with it.
+        """
+        endingStarts = {}
+        node = 0
+        for i in range(len(word) - 1, -1, -1):
+            node = self.endingTrie[node].get(word[i])
+            if node is None:
+                break
+            if self.endingParadigms[node] is not None:
+                for paraName in self.endingParadigms[node]:
+                    if paraName not in endingStarts:
+                        endingStarts[paraName] = i
+        return endingStarts
+
+    def transduce(self, word):
+        """
+        Return the list of stems found in the word, in the format
+        of MorphFST.transduce(): tuples (l, r, sublexeme, ()).
+        """
+        result = []
+        endingStarts = self.find_endings(word)
+        lastEndingStart = max(endingStarts.values(), default=-1)
+        for r in range(len(word)):
+            if r != len(word) - 1 and r >= lastEndingStart:
+                # Nothing that could follow the stem
+                continue
+            for stemLen in self.stemLengths:
+                l = r + 1 - stemLen
+                if l < 0:
+                    continue
+                try:
+                    suitableSubLex = self.stems[word[l:r+1]]
+                except KeyError:
+                    continue
+                for sl, startsInside, endsInside in suitableSubLex:
+                    if l > 0 and not startsInside:
+                        continue
+                    if r < len(word) - 1 and (not endsInside
+                                              or endingStarts.get(sl.paradigm, -1) <= r):
+                        continue
+                    result.append((l, r, sl, ()))
+        result += self.residualFst.transduce(word)
+        return result
+
+    def freeze(self):
+        """
+        Replace the residual FST with its compact version.
+        """
+        self.residualFst = self.residualFst.freeze()
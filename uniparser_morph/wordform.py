@@ -15,6 +15,10 @@ class Wordform:
                             'id', 'sem', 'sem2', 'flextype', 'upos', 'lexref', 'ref'}
     verbosity = 0
     
+    # Many candidate analyses are created for each token, so they do not keep a __dict__
+    __slots__ = ('g', 'errorHandler', 'wf', 'wfGlossed', 'wfGlossedStd', 'gloss',
+                 'lemma', 'gramm', 'stem', 'otherData', 'subwords')
+
     def __init__(self, g, sublex=None, flex=None, wf=None, errorHandler=None):
         self.g = g
         if errorHandler is None:
@@ -54,6 +58,12 @@ class Wordform:
         self.add_lemma(sublex.lex, flex)
         self.add_other_data(sublex.lex, flex)
 
+    def __copy__(self):
+        wfNew = Wordform.__new__(Wordform)
+        for field in Wordform.__slots__:
+            setattr(wfNew, field, getattr(self, field))
+        return wfNew
+
     def raise_error(self, message, data=None):
         if self.errorHandler is not None:
             self.errorHandler.raise_error(message, data)